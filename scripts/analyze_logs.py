@@ -1,10 +1,15 @@
+import json
+import os
+import time
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Any, Callable, Optional
 
 import click
-from build_log_analyzer import BuildLogAnalyzer
+from embedder import EMBEDDING_BACKENDS
 from log_downloader import LogDownloader
-from utils import copy_directory
+
+if TYPE_CHECKING:
+    from build_log_analyzer import BuildLogAnalyzer
 
 
 def download_logs(
@@ -14,9 +19,18 @@ def download_logs(
     username: Optional[str],
     password: Optional[str],
     output_dir: Path,
+    artifact_cache_max_gb: float = 20,
+    **downloader_options: Any,
 ) -> None:
     log_downloader = LogDownloader(
-        url, repository_path, log_file, username, password, output_dir
+        url,
+        repository_path,
+        log_file,
+        username,
+        password,
+        output_dir,
+        artifact_cache_max_bytes=int(artifact_cache_max_gb * 1024**3),
+        **downloader_options,
     )
     log_downloader.download_logs()
 
@@ -25,17 +39,340 @@ def analyze_logs(
     output_dir: Path,
     logs_dir: Optional[Path] = None,
     skip_process_failure_logs: bool = False,
+    **analyzer_options: Any,
+) -> None:
+    analyzer = prepare_analyzer(
+        output_dir, logs_dir, skip_process_failure_logs, **analyzer_options
+    )
+    try:
+        analyzer.analyze_and_visualize_clusters()
+    finally:
+        analyzer.close()
+    analyzer.echo_run_report()
+
+
+def assign_logs(
+    output_dir: Path,
+    model_dir: Path,
+    drift_threshold: float,
+    logs_dir: Optional[Path] = None,
+    skip_process_failure_logs: bool = False,
+    **analyzer_options: Any,
+) -> None:
+    # Reuse the embeddings of the analysis so that only new failures are embedded
+    if analyzer_options.get("cache_dir") is None:
+        analyzer_options["cache_dir"] = model_dir
+    analyzer = prepare_analyzer(
+        output_dir, logs_dir, skip_process_failure_logs, **analyzer_options
+    )
+    try:
+        analyzer.assign_to_clusters(model_dir, drift_threshold)
+    finally:
+        analyzer.close()
+    analyzer.echo_run_report()
+
+
+def query_logs(
+    log_files: list[Path],
+    model_dir: Path,
+    top_k: int,
+    build_type: Optional[str],
+    as_json: bool,
+    embedding_backend: str = "torch",
+    embedding_threads: Optional[int] = None,
+    cache_dir: Optional[Path] = None,
 ) -> None:
-    analyzer = BuildLogAnalyzer(output_dir)
+    """Print the saved cluster and the most similar clustered failures of each log."""
+    import numpy as np
+    from embedder import create_embedder, embedding_model
+    from log_extractors import extract_stacktrace
+    from log_sources import read_log
+    from signatures import normalize_signature
+    from vector_index import VectorIndex
+
+    saved_model_dir = os.path.join(model_dir, "model")
+    with open(os.path.join(saved_model_dir, "model.json")) as model_file:
+        model = json.load(model_file)
+    fitted_on = model.get("embedding_model", model["model_id"])
+    embedded_with = embedding_model(model["model_id"], embedding_backend)
+    if fitted_on != embedded_with:
+        raise click.ClickException(
+            f"Clusters in {model_dir} were fitted on {fitted_on} embeddings, "
+            f"not {embedded_with}, use the embedding backend they were fitted with"
+        )
+    try:
+        index = VectorIndex(saved_model_dir)
+    except FileNotFoundError:
+        raise click.ClickException(
+            f"No failure index in {model_dir}, run analyze again to create one"
+        )
+    centers = np.load(os.path.join(saved_model_dir, "centroids.npy"))
+
+    signatures = {}
+    for log_file in log_files:
+        _, log, _ = read_log(log_file)
+        extracted, messages = extract_stacktrace(
+            log, build_type or "unknown/other", log_file
+        )
+        # Without a build type, every extractor that did not match would report
+        if build_type:
+            for message in messages:
+                click.echo(message, err=True)
+        if not extracted or not extracted.strip():
+            click.echo(f"No failure found in {click.format_filename(log_file)}", err=True)
+            continue
+        signature = extracted.strip()
+        # Match how the indexed failures were grouped
+        if model.get("normalize_signatures", True):
+            signature = normalize_signature(signature)
+        signatures[log_file] = signature
+    if not signatures:
+        raise click.ClickException("No failure could be extracted from the logs")
+
+    embedder = create_embedder(
+        embedding_backend,
+        model_id=model["model_id"],
+        threads=embedding_threads,
+        onnx_dir=os.path.join(cache_dir or model_dir, "onnx"),
+    )
+    try:
+        embeddings = embedder.embed(list(signatures.values()), progress=False)
+    finally:
+        embedder.close()
+
+    results = []
+    for log_file, embedding in zip(signatures, embeddings):
+        start = time.perf_counter()
+        distances = np.linalg.norm(centers - embedding, axis=1)
+        cluster = int(distances.argmin())
+        similar = index.search(embedding, top_k)
+        elapsed = time.perf_counter() - start
+        results.append(
+            {
+                "log": str(log_file),
+                "cluster": cluster,
+                "distance": float(distances[cluster]),
+                # Farther from its centroid than 95% of the clustered failures
+                "outlier": bool(distances[cluster] > model["p95_distance"]),
+                "similar": similar,
+                "search_ms": elapsed * 1000,
+            }
+        )
+
+    if as_json:
+        click.echo(json.dumps(results, indent=2))
+        return
+    for result in results:
+        click.echo(
+            f"{click.format_filename(result['log'])}: cluster {result['cluster']} "
+            f"(distance {result['distance']:.3f}"
+            + (", farther than 95% of the clustered failures" if result["outlier"] else "")
+            + f"), searched {len(index)} failures in {result['search_ms']:.1f} ms"
+        )
+        for failure in result["similar"]:
+            click.echo(
+                f"  {failure['similarity']:.3f}  {failure['Path']} ({failure['Branch']}), "
+                f"cluster {failure['cluster']}"
+            )
 
-    if logs_dir:
-        copy_directory(logs_dir, output_dir)
+
+def prepare_analyzer(
+    output_dir: Path,
+    logs_dir: Optional[Path],
+    skip_process_failure_logs: bool,
+    **analyzer_options: Any,
+) -> "BuildLogAnalyzer":
+    """Load the failing builds of OUTPUT_DIR and extract their stack traces."""
+    # Imported here so that download and --help never load the analysis stack
+    from build_log_analyzer import BuildLogAnalyzer
+
+    os.makedirs(output_dir, exist_ok=True)
+    analyzer = BuildLogAnalyzer(output_dir, logs_source=logs_dir, **analyzer_options)
 
     if not skip_process_failure_logs:
         analyzer.process_failure_logs()
-    analyzer.load_failure_logs()
-    analyzer.extract_failure_stacktraces()
-    analyzer.analyze_and_visualize_clusters()
+    if not analyzer.resume_extracted_logs():
+        analyzer.load_failure_logs()
+        analyzer.extract_failure_stacktraces()
+    analyzer.normalize_failure_signatures()
+    return analyzer
+
+
+def analysis_options(command: Callable) -> Callable:
+    """Options shared by the subcommands that load, embed and cluster failures."""
+    options = [
+        click.option(
+            "--from",
+            "logs_dir",
+            type=click.Path(exists=True, path_type=Path),
+            help="Existing mass ingest logs directory or ingest zip, read in place",
+        ),
+        click.option(
+            "--skip-process-failure-logs",
+            is_flag=True,
+            help="Skip creating failures.csv file",
+        ),
+        click.option(
+            "--batch-size",
+            type=click.IntRange(min=1),
+            default=32,
+            show_default=True,
+            help="Number of extracted logs embedded per model forward pass",
+        ),
+        click.option(
+            "--embedding-backend",
+            type=click.Choice(EMBEDDING_BACKENDS),
+            default="torch",
+            show_default=True,
+            help="'onnx' runs the model exported to ONNX through ONNX Runtime, 'onnx-int8' with int8 quantized weights",
+        ),
+        click.option(
+            "--embedding-threads",
+            type=click.IntRange(min=1),
+            help="Intra-op threads of the embedding model, per worker process with --embedding-workers. Defaults to an equal share of the CPUs.",
+        ),
+        click.option(
+            "--embedding-workers",
+            type=click.IntRange(min=1),
+            default=1,
+            show_default=True,
+            help="Processes embedding shards of the extracted logs, each loading the model once",
+        ),
+        click.option(
+            "--cache-dir",
+            type=click.Path(file_okay=False, path_type=Path),
+            show_envvar=True,
+            envvar="EMBEDDING_CACHE_DIR",
+            help="Directory of the embedding cache and ONNX exports shared across runs. Defaults to OUTPUT_DIR.",
+        ),
+        click.option(
+            "--cache-max-entries",
+            type=click.IntRange(min=1),
+            default=200_000,
+            show_default=True,
+            help="Maximum number of cached embeddings before least recently used ones are evicted",
+        ),
+        click.option(
+            "--no-cache",
+            "use_cache",
+            is_flag=True,
+            flag_value=False,
+            default=True,
+            help="Embed every extracted log without reading or writing the embedding cache",
+        ),
+        click.option(
+            "--no-normalize-signatures",
+            "normalize_signatures",
+            is_flag=True,
+            flag_value=False,
+            default=True,
+            help="Only group extracted logs that are identical, keeping timestamps, paths, line numbers, hashes and versions",
+        ),
+        click.option(
+            "--sweep-workers",
+            type=click.IntRange(min=1),
+            help="Processes fitting candidate cluster counts concurrently. Defaults to the CPU count.",
+        ),
+        click.option(
+            "--silhouette-sample-size",
+            type=click.IntRange(min=2),
+            default=10_000,
+            show_default=True,
+            help="Rows in the fixed-seed stratified sample used to score each candidate cluster count",
+        ),
+        click.option(
+            "--sweep-patience",
+            type=click.IntRange(min=1),
+            help="Stop the cluster count sweep after this many candidates without a better score",
+        ),
+        click.option(
+            "--clustering-mode",
+            type=click.Choice(["standard", "large"]),
+            default="standard",
+            show_default=True,
+            help="'large' keeps embeddings in a memory-mapped file and fits KMeans and UMAP incrementally",
+        ),
+        click.option(
+            "--chunk-size",
+            type=click.IntRange(min=100),
+            default=8192,
+            show_default=True,
+            help="Rows read per chunk in the large clustering mode",
+        ),
+        click.option(
+            "--pca-components",
+            type=click.IntRange(min=0),
+            default=50,
+            show_default=True,
+            help="Dimensions the embeddings are reduced to with PCA before UMAP, 0 to skip PCA",
+        ),
+        click.option(
+            "--umap-sample-size",
+            type=click.IntRange(min=10),
+            default=20_000,
+            show_default=True,
+            help="Rows in the stratified per-cluster sample the projection is fitted on; the rest are transformed",
+        ),
+        click.option(
+            "--reuse-projection",
+            is_flag=True,
+            help="Place changed failures with the projection cached in OUTPUT_DIR instead of fitting a new one",
+        ),
+        click.option(
+            "--scatter-mode",
+            type=click.Choice(["inline", "webgl"]),
+            default="inline",
+            show_default=True,
+            help="'webgl' embeds only coordinates, cluster and build type per point and loads the log of a clicked point from clusters_scatter_data/",
+        ),
+        click.option(
+            "--scatter-max-points",
+            type=click.IntRange(min=1),
+            help="Downsample the scatter plot to about this many points, keeping the density of each cluster",
+        ),
+        click.option(
+            "--report-representatives",
+            type=click.IntRange(min=1),
+            default=25,
+            show_default=True,
+            help="Failures nearest to each cluster centroid, one per distinct signature, embedded in clusters_logs.html; the others are loaded on demand from clusters_logs_data/",
+        ),
+        click.option(
+            "--io-workers",
+            type=click.IntRange(min=1),
+            default=16,
+            show_default=True,
+            help="Maximum number of build logs read concurrently",
+        ),
+        click.option(
+            "--read-full-logs",
+            is_flag=True,
+            help="Read whole build logs instead of only the tail holding the failure markers",
+        ),
+        click.option(
+            "--extract-workers",
+            type=click.IntRange(min=1),
+            default=1,
+            show_default=True,
+            help="Processes extracting stack traces from the logs",
+        ),
+        click.option(
+            "--no-resume",
+            "resume",
+            is_flag=True,
+            flag_value=False,
+            default=True,
+            help="Recompute the extracted logs, embeddings, clusters and projection instead of resuming from the checkpoints in OUTPUT_DIR",
+        ),
+        click.option(
+            "--profile",
+            is_flag=True,
+            help="Profile every stage with cProfile and save the stats of the slowest one to OUTPUT_DIR/slowest_stage.prof",
+        ),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
 
 
 @click.group()
@@ -57,7 +394,7 @@ def cli() -> None:
     "--repository-path",
     show_envvar=True,
     envvar="ARTIFACTORY_REPOSITORY_PATH",
-    help="Repository path. Will interactively prompt for log file.",
+    help="Repository path. Will interactively prompt for log file unless --select, --since, --until or --latest is given.",
 )
 @click.option(
     "--log-file",
@@ -77,6 +414,69 @@ def cli() -> None:
     show_envvar=True,
     envvar="ARTIFACTORY_PASSWORD",
 )
+@click.option(
+    "--no-extract",
+    "extract",
+    is_flag=True,
+    flag_value=False,
+    default=True,
+    help="Keep the ingest zip in OUTPUT_DIR instead of extracting it, for analyze --from",
+)
+@click.option(
+    "--download-workers",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="Byte ranges of a large artifact fetched concurrently",
+)
+@click.option(
+    "--buffer-size",
+    type=click.IntRange(min=1024),
+    default=1024 * 1024,
+    show_default=True,
+    help="Bytes read from the network per write",
+)
+@click.option(
+    "--artifact-cache-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    show_envvar=True,
+    envvar="ARTIFACT_CACHE_DIR",
+    help="Directory caching downloaded zips by their Artifactory sha256 checksum",
+)
+@click.option(
+    "--artifact-cache-max-gb",
+    type=click.FloatRange(min=0),
+    default=20,
+    show_default=True,
+    help="Size of the artifact cache before least recently used zips are evicted",
+)
+@click.option(
+    "--select",
+    "artifact_glob",
+    help="Download every zip whose path below --repository-path matches this glob, e.g. '9-20/*'",
+)
+@click.option(
+    "--since",
+    type=click.DateTime(),
+    help="Download every zip below --repository-path stamped at or after this date",
+)
+@click.option(
+    "--until",
+    type=click.DateTime(),
+    help="Download every zip below --repository-path stamped before this date",
+)
+@click.option(
+    "--latest",
+    type=click.IntRange(min=1),
+    help="Download only the most recently stamped zips below --repository-path",
+)
+@click.option(
+    "--concurrency",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="Folders listed and zips downloaded concurrently when selecting with --select, --since, --until or --latest",
+)
 def download(
     output_dir: Path,
     url: str,
@@ -84,37 +484,121 @@ def download(
     log_file: Optional[str],
     username: Optional[str],
     password: Optional[str],
+    **options: Any,
 ) -> None:
-    """Download logs from Artifactory."""
+    """Download logs from Artifactory.
+
+    Interrupted downloads resume from where they stopped when run again.
+    Selecting zips with --select, --since, --until or --latest downloads all
+    of them without prompting, each into its own subdirectory of OUTPUT_DIR.
+    """
     if not (repository_path or log_file) or (repository_path and log_file):
         raise click.UsageError(
             "Either --repository-path or --log-file must be provided"
         )
+    selectors = ("artifact_glob", "since", "until", "latest")
+    if log_file and any(options[selector] is not None for selector in selectors):
+        raise click.UsageError(
+            "--select, --since, --until and --latest require --repository-path"
+        )
 
-    download_logs(url, repository_path, log_file, username, password, output_dir)
+    download_logs(
+        url, repository_path, log_file, username, password, output_dir, **options
+    )
 
 
 # https://artifactory.moderne.ninja/artifactory/moderne-ingest/io/moderne/ingest-log/9-20/202412190022/ingest-log-202412190022-9.zip
+@cli.command()
+@click.argument("output_dir", type=click.Path(path_type=Path))
+@analysis_options
+def analyze(output_dir: Path, **options: Any) -> None:
+    """Perform K-Means clustering on Mass Ingest build failure logs."""
+    analyze_logs(output_dir, **options)
+
+
 @cli.command()
 @click.argument("output_dir", type=click.Path(path_type=Path))
 @click.option(
-    "--from",
-    "logs_dir",
-    type=click.Path(exists=True, path_type=Path),
-    help="Path to existing mass ingest logs directory",
+    "--model-dir",
+    required=True,
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+    help="Output directory of a previous analyze run whose clusters are reused",
 )
 @click.option(
-    "--skip-process-failure-logs",
-    is_flag=True,
-    help="Skip creating failures.csv file",
+    "--drift-threshold",
+    type=click.FloatRange(min=1.0),
+    default=1.25,
+    show_default=True,
+    help="Recluster when the 95th percentile assignment distance grows by more than this factor",
 )
-def analyze(
-    output_dir: Path,
-    logs_dir: Optional[Path] = None,
-    skip_process_failure_logs: bool = False,
+@analysis_options
+def assign(
+    output_dir: Path, model_dir: Path, drift_threshold: float, **options: Any
 ) -> None:
-    """Perform K-Means clustering on Mass Ingest build failure logs."""
-    analyze_logs(output_dir, logs_dir, skip_process_failure_logs)
+    """Assign new build failures to the clusters of a previous analysis.
+
+    Embeddings are cached in --model-dir unless --cache-dir is given.
+    """
+    assign_logs(output_dir, model_dir, drift_threshold, **options)
+
+
+@cli.command()
+@click.argument(
+    "log_files",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+)
+@click.option(
+    "--model-dir",
+    required=True,
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+    help="Output directory of a previous analyze run whose failures are searched",
+)
+@click.option(
+    "--top-k",
+    type=click.IntRange(min=1),
+    default=5,
+    show_default=True,
+    help="Number of most similar failures listed per log",
+)
+@click.option(
+    "--build-type",
+    type=click.Choice(["maven", "gradle", "bazel", "dotnet"]),
+    help="Build tool that wrote the logs. Defaults to trying each extractor.",
+)
+@click.option(
+    "--json",
+    "as_json",
+    is_flag=True,
+    help="Print the results as JSON",
+)
+@click.option(
+    "--embedding-backend",
+    type=click.Choice(EMBEDDING_BACKENDS),
+    default="torch",
+    show_default=True,
+    help="'onnx' runs the model exported to ONNX through ONNX Runtime, 'onnx-int8' with int8 quantized weights",
+)
+@click.option(
+    "--embedding-threads",
+    type=click.IntRange(min=1),
+    help="Intra-op threads of the embedding model. Defaults to all CPUs.",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    show_envvar=True,
+    envvar="EMBEDDING_CACHE_DIR",
+    help="Directory of the ONNX exports shared across runs. Defaults to --model-dir.",
+)
+def query(log_files: tuple[Path, ...], model_dir: Path, **options: Any) -> None:
+    """Find the cluster and the most similar past failures of build logs.
+
+    The logs are extracted and embedded like in analyze, then looked up in the
+    failure index saved by the analyze run in --model-dir.
+    """
+    query_logs(list(log_files), model_dir, **options)
 
 
 if __name__ == "__main__":
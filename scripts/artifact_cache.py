@@ -0,0 +1,61 @@
+import os
+import threading
+
+# Suffix of artifacts still being downloaded into the cache
+PARTIAL_SUFFIX = ".part"
+
+
+class ArtifactCache:
+    """Content-addressed store of downloaded artifacts keyed by their sha256 checksum.
+
+    Artifacts are evicted least-recently-used first once the cache holds more
+    than `max_bytes`. A hit refreshes the modification time that orders the
+    eviction.
+    """
+
+    def __init__(self, cache_dir, max_bytes=20 * 1024**3):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+    def path(self, sha256):
+        return os.path.join(self.cache_dir, sha256)
+
+    def partial_path(self, sha256):
+        """Where an artifact is downloaded before it is verified and added."""
+        return self.path(sha256) + PARTIAL_SUFFIX
+
+    def get(self, sha256):
+        path = self.path(sha256)
+        with self.lock:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                return None
+        return path
+
+    def put(self, sha256, downloaded_path):
+        """Move a verified download into the cache and return its cached path."""
+        path = self.path(sha256)
+        with self.lock:
+            os.replace(downloaded_path, path)
+            self._evict(keep=path)
+        return path
+
+    def _evict(self, keep):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            # Completed artifacts are named by their bare checksum, partial downloads
+            # and their resume state are not evicted
+            if entry.is_file() and "." not in entry.name:
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            # Never evict the artifact that was just added, even if it alone exceeds the cap
+            if path != keep:
+                os.remove(path)
+                total -= size
@@ -0,0 +1,1490 @@
+import hashlib
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+
+import click
+import numpy as np
+from utils import directory_size
+
+
+def synthetic_extracted_logs(rows, seed=42):
+    """Generate extracted-log-like strings with a realistic spread of lengths."""
+    rng = random.Random(seed)
+    exceptions = [
+        "org.gradle.api.GradleException: Could not resolve all dependencies",
+        "java.lang.NullPointerException: Cannot invoke method on null",
+        "org.apache.maven.plugin.MojoExecutionException: Compilation failure",
+        "java.io.FileNotFoundException: settings.gradle (No such file or directory)",
+        "error CS0246: The type or namespace name could not be found",
+    ]
+    logs = []
+    for i in range(rows):
+        if i % 50 == 0:
+            logs.append("" if i % 100 == 0 else None)
+            continue
+        lines = ["* Exception is:", rng.choice(exceptions)]
+        for _ in range(rng.randint(0, 60)):
+            lines.append(
+                f"\tat com.example.module{rng.randint(0, 99)}.Class{rng.randint(0, 999)}"
+                f".method(Class.java:{rng.randint(1, 2000)})"
+            )
+        logs.append("\n".join(lines))
+    return logs
+
+
+# Shapes of the synthetic logs: one failure block, several blocks, a start marker
+# left unclosed before the last block, a block missing its end marker, and no
+# block so that the extractors fall back to "BUILD FAILED with an exception:"
+LOG_SHAPES = ["single", "blocks", "unclosed", "no_end", "fallback"]
+
+
+def synthetic_build_log(rng, build_type, lines, shape="single"):
+    """Generate a build log with `lines` lines of noise and failure sections of `shape`."""
+
+    def noise(count):
+        return [
+            f"[INFO] Compiling {rng.randint(1, 500)} source files to /tmp/build/classes"
+            if rng.random() < 0.5
+            else f"> Task :module{rng.randint(0, 99)}:compileJava UP-TO-DATE"
+            for _ in range(count)
+        ]
+
+    def frames():
+        return [
+            f"\tat com.example.Class{rng.randint(0, 999)}.method(Class.java:{rng.randint(1, 900)})"
+            for _ in range(rng.randint(5, 40))
+        ]
+
+    def failure(closed=True):
+        if build_type == "maven":
+            block = [
+                "[INFO] BUILD FAILURE",
+                f"[ERROR] Failed to execute goal on project example{rng.randint(0, 99)}",
+                *frames(),
+                "\tat org.apache.maven.lifecycle.internal.MojoExecutor.doExecute(MojoExecutor.java:1)",
+                *frames(),
+                "Caused by: java.lang.IllegalStateException: boom",
+                *frames(),
+            ]
+            end = ["[ERROR] Re-run Maven using the -X switch to enable full debug logging."]
+        else:
+            block = [
+                "* Exception is:",
+                f"org.gradle.api.GradleException: Could not resolve module{rng.randint(0, 99)}",
+                "\tat org.gradle.api.internal.Foo.bar(Foo.java:1)",
+                *frames(),
+                "Caused by: java.io.IOException: boom",
+                *frames(),
+            ]
+            end = ["* Get more help at https://help.gradle.org"]
+        return block + end if closed else block
+
+    start = failure()[0]
+    fallback = ["", "BUILD FAILED with an exception:", ""]
+    if shape == "single":
+        body = noise(lines) + failure()
+    elif shape == "blocks":
+        third = lines // 3
+        body = noise(third) + failure() + noise(third) + failure() + noise(third) + failure()
+    elif shape == "unclosed":
+        half = lines // 2
+        body = noise(half) + failure() + [start] + noise(lines - half) + failure()
+    elif shape == "no_end":
+        # Gradle then ends the block at "BUILD FAILED in", Maven falls back
+        body = noise(lines) + failure(closed=False) + noise(10)
+    elif shape == "fallback":
+        body = noise(lines)
+        fallback = ["", "BUILD FAILED with an exception:", *frames(), *noise(10)]
+    else:
+        raise ValueError(shape)
+    return "\n".join(body + ["BUILD FAILED in 12s"] + fallback)
+
+
+def legacy_extract(log, build_type):
+    """Reference implementation of the regex-based extraction the marker scanners replaced."""
+    if build_type == "maven":
+        patterns = [
+            r"(\[INFO\] BUILD FAILURE.*?Re-run Maven using the -X switch to enable full debug logging\.)",
+            r"(BUILD FAILED with an exception:.*)",
+        ]
+        keep = ("[INFO] BUILD FAILURE", "Caused by:", "BUILD FAILED with an exception")
+        remove = (
+            "at org.apache.maven.plugin.DefaultMojosExecutionStrategy",
+            "at org.apache.maven.lifecycle.internal.LifecycleDependencyResolver",
+            "at org.apache.maven.lifecycle.internal.MojoExecutor.doExecute",
+        )
+    else:
+        patterns = [
+            r"(\* Exception is:.*?\* Get more help at https://help\.gradle\.org)",
+            r"(\* Exception is:.*?BUILD FAILED in)",
+            r"(BUILD FAILED with an exception:.*)",
+        ]
+        keep = ("* Exception is", "Caused by: ", "BUILD FAILED with an exception")
+        remove = (
+            "at org.gradle.api.internal",
+            "at org.gradle.process.internal.DefaultExecHandle",
+            "at org.gradle.internal.DefaultBuildOperationRunner",
+        )
+    matches = []
+    for pattern in patterns:
+        matches = re.findall(pattern, log, re.DOTALL)
+        if len(matches) > 0:
+            break
+    if len(matches) == 0:
+        return None
+    lines_to_keep = []
+    start_removing = True
+    for line in matches[-1].split("\n"):
+        if any(marker in line for marker in keep):
+            start_removing = False
+        elif any(marker in line for marker in remove):
+            start_removing = True
+        if not start_removing:
+            lines_to_keep.append(line)
+    return "\n".join(lines_to_keep)
+
+
+class StandInArtifactHandler(BaseHTTPRequestHandler):
+    """Serves the server's payload with Range support, a per-connection rate and faults."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        if self.server.reject_head:
+            self.send_error(405)
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.server.payload)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", '"stand-in"')
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path.startswith("/api/storage/"):
+            # Storage API item info, as Artifactory reports it for files
+            body = json.dumps({"checksums": {"sha256": self.server.sha256}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        payload = self.server.payload
+        start, end = 0, len(payload)
+        if "Range" in self.headers:
+            first, last = self.headers["Range"].removeprefix("bytes=").split("-")
+            start, end = int(first), int(last) + 1 if last else len(payload)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(payload)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(end - start))
+        self.end_headers()
+
+        with self.server.lock:
+            self.server.requests += 1
+            # Faulty requests close the connection halfway through the body
+            truncate = self.server.faults > 0
+            self.server.faults -= truncate
+        stop = start + (end - start) // 2 if truncate else end
+        block = 256 * 1024
+        for offset in range(start, stop, block):
+            with self.server.lock:
+                if self.server.budget is not None and self.server.budget <= 0:
+                    truncate = True
+                    break
+                chunk = payload[offset : min(offset + block, stop)]
+                self.server.served += len(chunk)
+                if self.server.budget is not None:
+                    self.server.budget -= len(chunk)
+            self.wfile.write(chunk)
+            time.sleep(len(chunk) / self.server.connection_rate)
+        if truncate:
+            self.close_connection = True
+
+
+class FakeArtifactoryHandler(BaseHTTPRequestHandler):
+    """Serves the server's files and their storage API listings after a fixed latency."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, body, content_type="application/octet-stream"):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command == "GET":
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        path = self.path.strip("/")
+        if not path.startswith("api/storage/"):
+            if path not in self.server.files:
+                self.send_error(404)
+                return
+            self.send_body(self.server.files[path])
+            return
+
+        path = path.removeprefix("api/storage/")
+        if path in self.server.files:
+            info = {"checksums": {"sha256": hashlib.sha256(self.server.files[path]).hexdigest()}}
+        else:
+            children = {
+                name[len(path) + 1 :].split("/")[0]: "/" in name[len(path) + 1 :]
+                for name in self.server.files
+                if name.startswith(path + "/")
+            }
+            info = {
+                "children": [
+                    {"uri": "/" + child, "folder": folder}
+                    for child, folder in sorted(children.items())
+                ]
+            }
+        self.send_body(json.dumps(info).encode(), "application/json")
+
+
+def stand_in_server(payload, connection_rate):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInArtifactHandler)
+    server.daemon_threads = True
+    server.payload = payload
+    server.sha256 = hashlib.sha256(payload).hexdigest()
+    server.connection_rate = connection_rate
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.served = 0
+    server.faults = 0
+    server.budget = None
+    server.reject_head = False
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@click.group()
+def cli() -> None:
+    """Benchmarks for the build log analysis pipeline."""
+    pass
+
+
+@cli.command()
+@click.option("--rows", type=click.IntRange(min=1), default=512, show_default=True)
+@click.option(
+    "--batch-size",
+    "batch_sizes",
+    type=click.IntRange(min=1),
+    multiple=True,
+    default=[8, 32, 64],
+    show_default=True,
+)
+def embedding(rows: int, batch_sizes: list[int]) -> None:
+    """Compare per-row and batched embedding throughput."""
+    from embedder import Embedder
+
+    embedder = Embedder()
+    logs = synthetic_extracted_logs(rows)
+
+    start = time.perf_counter()
+    per_row = np.array([embedder.embed_one(log) for log in logs], dtype=np.float32)
+    per_row_elapsed = time.perf_counter() - start
+    click.echo(f"per-row: {rows / per_row_elapsed:.1f} rows/s ({per_row_elapsed:.2f}s)")
+
+    for batch_size in batch_sizes:
+        start = time.perf_counter()
+        batched = embedder.embed(logs, batch_size=batch_size, progress=False)
+        elapsed = time.perf_counter() - start
+        max_diff = float(np.abs(batched - per_row).max())
+        click.echo(
+            f"batch size {batch_size}: {rows / elapsed:.1f} rows/s ({elapsed:.2f}s), "
+            f"speedup {per_row_elapsed / elapsed:.1f}x, max abs diff {max_diff:.2e}"
+        )
+
+
+@cli.command("embedding-scaling")
+@click.option("--rows", type=click.IntRange(min=1), default=4096, show_default=True)
+@click.option("--batch-size", type=click.IntRange(min=1), default=32, show_default=True)
+@click.option(
+    "--backend", type=click.Choice(["torch", "onnx", "onnx-int8"]), default="torch"
+)
+@click.option(
+    "--workers",
+    "worker_counts",
+    type=click.IntRange(min=1),
+    multiple=True,
+    default=[1, 2, 4, 8],
+    show_default=True,
+)
+def embedding_scaling(
+    rows: int, batch_size: int, backend: str, worker_counts: list[int]
+) -> None:
+    """Measure embedding throughput across worker process counts."""
+    from embedder import create_embedder
+
+    logs = synthetic_extracted_logs(rows)
+    baseline = None
+    baseline_rate = None
+    for workers in worker_counts:
+        embedder = create_embedder(backend, workers=workers, batch_size=batch_size)
+        try:
+            # Load the model in every worker before timing
+            embedder.embed(logs[: workers * batch_size], progress=False)
+            start = time.perf_counter()
+            embeddings = embedder.embed(logs, progress=False)
+            elapsed = time.perf_counter() - start
+        finally:
+            embedder.close()
+
+        baseline = embeddings if baseline is None else baseline
+        baseline_rate = baseline_rate or rows / elapsed
+        click.echo(
+            f"{workers} worker{'s' if workers != 1 else ''}: {rows / elapsed:.1f} rows/s "
+            f"({elapsed:.2f}s), speedup {rows / elapsed / baseline_rate:.2f}x, "
+            f"max abs diff {float(np.abs(embeddings - baseline).max()):.2e}"
+        )
+
+
+@cli.command()
+@click.option("--rows", type=click.IntRange(min=1), default=2000, show_default=True)
+@click.option("--batch-size", type=click.IntRange(min=1), default=32, show_default=True)
+@click.option(
+    "--threads",
+    "thread_counts",
+    type=click.IntRange(min=1),
+    multiple=True,
+    help="Intra-op thread counts to try for the ONNX Runtime backends. Defaults to the CPU count.",
+)
+@click.option("--clusters", type=click.IntRange(min=2), default=12, show_default=True)
+@click.option(
+    "--min-cosine",
+    type=click.FloatRange(0, 1),
+    default=0.99,
+    show_default=True,
+    help="Fail when any row is less similar than this to its torch embedding",
+)
+@click.option(
+    "--min-agreement",
+    type=click.FloatRange(0, 1),
+    default=0.98,
+    show_default=True,
+    help="Fail when fewer rows than this fraction keep their torch cluster",
+)
+@click.option(
+    "--onnx-dir",
+    type=click.Path(file_okay=False),
+    default="onnx",
+    show_default=True,
+    help="Where the ONNX exports are kept between runs",
+)
+def onnx(
+    rows: int,
+    batch_size: int,
+    thread_counts: list[int],
+    clusters: int,
+    min_cosine: float,
+    min_agreement: float,
+    onnx_dir: str,
+) -> None:
+    """Check the ONNX Runtime backends against torch and compare their throughput."""
+    from clustering import nearest_centroids
+    from embedder import create_embedder
+    from sklearn.cluster import KMeans
+
+    logs = synthetic_extracted_logs(rows)
+    nonempty = np.array([bool(log) for log in logs])
+
+    embedder = create_embedder("torch", batch_size=batch_size)
+    start = time.perf_counter()
+    reference = embedder.embed(logs, progress=False)
+    elapsed = time.perf_counter() - start
+    click.echo(f"torch: {rows / elapsed:.1f} rows/s ({elapsed:.2f}s)")
+
+    # Clusters fitted on the torch embeddings, as a saved model would hold them
+    centers = KMeans(n_clusters=clusters, n_init=10, random_state=42).fit(
+        reference[nonempty]
+    ).cluster_centers_
+    reference_labels, _ = nearest_centroids(reference[nonempty], centers)
+
+    failed = False
+    for backend in ["onnx", "onnx-int8"]:
+        for threads in thread_counts or [os.cpu_count() or 1]:
+            embedder = create_embedder(
+                backend, batch_size=batch_size, threads=threads, onnx_dir=onnx_dir
+            )
+            embedder.embed(logs[:batch_size], progress=False)  # warm up
+            start = time.perf_counter()
+            embeddings = embedder.embed(logs, progress=False)
+            elapsed = time.perf_counter() - start
+
+            cosine = (embeddings[nonempty] * reference[nonempty]).sum(axis=1)
+            labels, _ = nearest_centroids(embeddings[nonempty], centers)
+            agreement = float((labels == reference_labels).mean())
+            failed |= cosine.min() < min_cosine or agreement < min_agreement
+            click.echo(
+                f"{backend}, {threads} thread{'s' if threads != 1 else ''}: "
+                f"{rows / elapsed:.1f} rows/s ({elapsed:.2f}s), cosine to torch "
+                f"min {cosine.min():.4f} mean {cosine.mean():.4f}, "
+                f"same cluster {agreement:.2%}"
+            )
+    if failed:
+        raise SystemExit(1)
+
+
+@cli.command("k-selection")
+@click.option(
+    "--rows",
+    "row_counts",
+    type=click.IntRange(min=30),
+    multiple=True,
+    default=[200, 600, 1500],
+    show_default=True,
+)
+@click.option("--clusters", type=click.IntRange(min=2), default=8, show_default=True)
+@click.option(
+    "--workers",
+    "worker_counts",
+    type=click.IntRange(min=1),
+    multiple=True,
+    default=[1, 4],
+    show_default=True,
+)
+def k_selection(row_counts: list[int], clusters: int, worker_counts: list[int]) -> None:
+    """Check that select_k picks the k of the serial silhouette loop on small inputs.
+
+    Inputs are smaller than the silhouette sample, so every row is scored, as the
+    serial loop did. Also fails when a serial sweep leaves its thread limit set.
+    """
+    from clustering import select_k
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import silhouette_score
+    from threadpoolctl import threadpool_info
+
+    def thread_counts():
+        return [pool["num_threads"] for pool in threadpool_info()]
+
+    rng = np.random.default_rng(42)
+    failed = False
+    for rows in row_counts:
+        centers = rng.normal(size=(clusters, 384))
+        embeddings = centers[rng.integers(0, clusters, rows)] + rng.normal(
+            scale=0.8, size=(rows, 384)
+        )
+        embeddings = (embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)).astype(
+            np.float32
+        )
+        kmax = min(20, rows - 1)
+
+        # The loop select_k replaced
+        start = time.perf_counter()
+        best_score, expected = -100, None
+        for k in range(3, kmax + 1):
+            labels = KMeans(n_clusters=k, n_init=10, random_state=42).fit_predict(embeddings)
+            score = silhouette_score(embeddings, labels, metric="euclidean")
+            if score > best_score:
+                best_score, expected = score, labels
+        serial_elapsed = time.perf_counter() - start
+        expected_k = len(set(expected))
+        click.echo(f"{rows} rows: serial loop k={expected_k} ({serial_elapsed:.2f}s)")
+
+        for workers in worker_counts:
+            before = thread_counts()
+            start = time.perf_counter()
+            labels, _, _ = select_k(embeddings, k_min=3, k_max=kmax, workers=workers)
+            elapsed = time.perf_counter() - start
+            k = len(set(labels))
+            same = k == expected_k and (labels == expected).all()
+            leaked = thread_counts() != before
+            failed |= not same or leaked
+            click.echo(
+                f"  select_k, {workers} worker{'s' if workers != 1 else ''}: k={k} "
+                f"({elapsed:.2f}s), {'same' if same else 'different'} labels"
+                + (", thread limit left set" if leaked else "")
+            )
+    if failed:
+        raise SystemExit(1)
+
+
+@cli.command()
+@click.option(
+    "--logs-dir",
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+    help="Golden corpus: every *.log file below this directory is extracted as both build types",
+)
+@click.option("--rows", type=click.IntRange(min=1), default=20, show_default=True)
+@click.option(
+    "--lines",
+    type=click.IntRange(min=0),
+    default=200_000,
+    show_default=True,
+    help="Noise lines per synthetic log",
+)
+def extraction(logs_dir: Optional[Path], rows: int, lines: int) -> None:
+    """Check the marker scanners against the regex extraction and compare throughput.
+
+    The scanners are checked on whole logs and on the log tails read_log reads,
+    starting from a small window so that it has to grow. A synthetic log with a
+    single failure block must be extracted from a tail, not the whole log. Tails
+    are also read as a stream, as from an ingest zip, through a rolling buffer
+    much smaller than the logs.
+    """
+    import io
+
+    import log_sources
+    from log_extractors import extract_gradle, extract_maven
+    from log_sources import _read_stream_tail, _read_tail
+
+    extractors = {"maven": extract_maven, "gradle": extract_gradle}
+    if logs_dir:
+        corpus = [
+            (build_type, path.read_text(encoding="UTF-8"))
+            for path in sorted(logs_dir.rglob("*.log"))
+            for build_type in extractors
+        ]
+        shapes = [None] * len(corpus)
+    else:
+        rng = random.Random(42)
+        corpus, shapes = [], []
+        for row in range(rows):
+            shape = LOG_SHAPES[row % len(LOG_SHAPES)]
+            for build_type in extractors:
+                corpus.append((build_type, synthetic_build_log(rng, build_type, lines, shape)))
+                shapes.append(shape)
+    megabytes = sum(len(log.encode("UTF-8")) for _, log in corpus) / 1024**2
+
+    start = time.perf_counter()
+    expected = [legacy_extract(log, build_type) for build_type, log in corpus]
+    legacy_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = [extractors[build_type](log) for build_type, log in corpus]
+    elapsed = time.perf_counter() - start
+
+    # Small chunks so that markers straddle the chunks dropped from the buffer
+    log_sources.STREAM_CHUNK_SIZE = 1000
+    tails = []
+    stream_tails = []
+    single_read = single_size = whole_reads = 0
+    for (build_type, log), shape in zip(corpus, shapes):
+        data = log.encode("UTF-8")
+        tail, bytes_read = _read_tail(data, build_type, window=64)
+        tails.append(extractors[build_type](tail))
+        stream_tail, _ = _read_stream_tail(
+            lambda: io.BytesIO(data), len(data), build_type, window=64, max_window=4096
+        )
+        stream_tails.append(extractors[build_type](stream_tail))
+        if shape == "single":
+            single_read += bytes_read
+            single_size += len(data)
+            whole_reads += bytes_read == len(data)
+
+    mismatches = sum(a != b for a, b in zip(expected, actual))
+    tail_mismatches = sum(a != b for a, b in zip(expected, tails))
+    stream_mismatches = sum(a != b for a, b in zip(expected, stream_tails))
+    if single_size:
+        click.echo(
+            f"single failure block: read {single_read:,} of {single_size:,} bytes, "
+            f"{whole_reads} whole logs"
+        )
+    click.echo(f"regex: {megabytes / legacy_elapsed:.1f} MB/s ({legacy_elapsed:.2f}s)")
+    click.echo(f"marker scanner: {megabytes / elapsed:.1f} MB/s ({elapsed:.2f}s)")
+    click.echo(f"{mismatches} of {len(corpus)} extractions differ")
+    click.echo(f"{tail_mismatches} of {len(corpus)} extractions from the log tail differ")
+    click.echo(
+        f"{stream_mismatches} of {len(corpus)} extractions from the streamed log tail differ"
+    )
+    if mismatches or tail_mismatches or stream_mismatches or whole_reads:
+        raise SystemExit(1)
+
+
+def synthetic_volatile_logs(rows, failures=50, seed=42):
+    """Generate extracted logs of a few failures that differ only in volatile tokens."""
+    rng = random.Random(seed)
+    templates = [
+        [
+            f"* Exception is: com.example.Failure{failure}Exception: "
+            + rng.choice(["Could not resolve", "Compilation failed for", "Timeout in"])
+            + " {artifact}:{version}",
+            *[
+                f"\tat com.example.module{failure}.Class{frame}.method(Class{frame}.java:{{line{frame}}})"
+                for frame in range(rng.randint(2, 8))
+            ],
+            "Caused by: java.io.IOException: {tmpdir}/work/out.bin (No such file or directory)",
+            "\tat {timestamp} in {workspace}/src/main/java/App.java:{line0}",
+            "Build file '{workspace}/build.gradle' line: {line1}",
+            "Build scan: https://scans.example.com/s/{hash}",
+        ]
+        for failure in range(failures)
+    ]
+    logs = []
+    for _ in range(rows):
+        template = rng.choice(templates)
+        values = {
+            "artifact": "org.example:lib",
+            "version": f"{rng.randint(1, 9)}.{rng.randint(0, 20)}.{rng.randint(0, 9)}",
+            "tmpdir": f"/tmp/gradle-worker-{rng.getrandbits(32):08x}",
+            "timestamp": f"2024-12-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00Z",
+            "workspace": f"/home/runner/work/repo{rng.randint(0, 999)}/repo",
+            "hash": f"{rng.getrandbits(64):016x}",
+            **{f"line{frame}": rng.randint(1, 2000) for frame in range(8)},
+        }
+        logs.append("\n".join(line.format(**values) for line in template))
+    return logs
+
+
+@cli.command()
+@click.option("--rows", type=click.IntRange(min=1), default=20_000, show_default=True)
+@click.option(
+    "--failures",
+    type=click.IntRange(min=1),
+    default=50,
+    show_default=True,
+    help="Distinct failures the synthetic extracted logs are drawn from",
+)
+def signatures(rows: int, failures: int) -> None:
+    """Measure how far signature normalization shrinks the logs to embed and cluster."""
+    from signatures import normalize_signature
+
+    logs = synthetic_volatile_logs(rows, failures)
+    start = time.perf_counter()
+    normalized = [normalize_signature(log) for log in logs]
+    elapsed = time.perf_counter() - start
+    click.echo(f"{rows} extracted logs, {len(set(logs))} distinct before normalization")
+    click.echo(
+        f"{len(set(normalized))} distinct signatures after normalization "
+        f"({rows / len(set(normalized)):.0f}x fewer rows to embed), "
+        f"normalized at {rows / elapsed:.0f} logs/s"
+    )
+    if len(set(normalized)) > failures:
+        click.echo(f"expected at most {failures} distinct signatures")
+        raise SystemExit(1)
+
+
+@cli.command("extraction-scaling")
+@click.option("--rows", type=click.IntRange(min=1), default=2000, show_default=True)
+@click.option("--lines", type=click.IntRange(min=0), default=2000, show_default=True)
+@click.option(
+    "--workers",
+    "worker_counts",
+    type=click.IntRange(min=1),
+    multiple=True,
+    default=[1, 4, 16],
+    show_default=True,
+)
+def extraction_scaling(rows: int, lines: int, worker_counts: list[int]) -> None:
+    """Measure extract_stacktraces throughput across process pool sizes."""
+    from log_extractors import extract_stacktraces
+
+    rng = random.Random(42)
+    build_types = [rng.choice(["maven", "gradle", "unknown/other"]) for _ in range(rows)]
+    logs = [
+        synthetic_build_log(rng, "gradle" if build_type != "maven" else "maven", lines)
+        for build_type in build_types
+    ]
+    paths = [f"org/repo{i}" for i in range(rows)]
+
+    serial = extract_stacktraces(logs, build_types, paths, workers=1)
+    failed = False
+    for workers in worker_counts:
+        start = time.perf_counter()
+        results = extract_stacktraces(logs, build_types, paths, workers=workers)
+        elapsed = time.perf_counter() - start
+        failed |= results != serial
+        click.echo(
+            f"{workers} worker{'s' if workers != 1 else ''}: {rows / elapsed:.1f} logs/s "
+            f"({elapsed:.2f}s), same results as serial: {results == serial}"
+        )
+    if failed:
+        raise SystemExit(1)
+
+
+@cli.command()
+@click.option("--megabytes", type=click.IntRange(min=1), default=64, show_default=True)
+@click.option(
+    "--connection-rate",
+    type=click.IntRange(min=1),
+    default=50,
+    show_default=True,
+    help="MB/s the stand-in server sends per connection",
+)
+@click.option(
+    "--part-size",
+    type=click.IntRange(min=1),
+    default=8,
+    show_default=True,
+    help="MB per byte range",
+)
+@click.option(
+    "--workers",
+    "worker_counts",
+    type=click.IntRange(min=1),
+    multiple=True,
+    default=[1, 4, 8],
+    show_default=True,
+)
+def download(
+    megabytes: int, connection_rate: int, part_size: int, worker_counts: list[int]
+) -> None:
+    """Download from a local stand-in server: throughput, dropped connections and resume."""
+    import log_downloader
+    import requests
+    from log_downloader import LogDownloader
+
+    log_downloader.RANGE_PART_SIZE = part_size * 1024**2
+    payload = np.random.default_rng(42).bytes(megabytes * 1024**2)
+    expected = hashlib.sha256(payload).hexdigest()
+    server = stand_in_server(payload, connection_rate * 1024**2)
+    url = f"http://127.0.0.1:{server.server_port}/ingest.zip"
+
+    failed = False
+
+    def matches(path):
+        nonlocal failed
+        with open(path, "rb") as f:
+            intact = hashlib.file_digest(f, "sha256").hexdigest() == expected
+        failed |= not intact
+        return intact
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "ingest.zip")
+
+        # The previous downloader: a fresh connection streamed in 8 KB chunks
+        start = time.perf_counter()
+        with requests.get(url, stream=True, timeout=30) as r:
+            with open(path, "wb") as f:
+                for chunk in r.iter_content(chunk_size=8192):
+                    f.write(chunk)
+        elapsed = time.perf_counter() - start
+        click.echo(f"single stream: {megabytes / elapsed:.1f} MB/s, intact: {matches(path)}")
+
+        for workers in worker_counts:
+            os.remove(path)
+            downloader = LogDownloader(url, None, None, None, None, tmp, download_workers=workers)
+            start = time.perf_counter()
+            downloader._download_file(url, path)
+            elapsed = time.perf_counter() - start
+            click.echo(
+                f"{workers} range worker{'s' if workers != 1 else ''}: "
+                f"{megabytes / elapsed:.1f} MB/s, intact: {matches(path)}"
+            )
+
+        workers = max(worker_counts)
+        os.remove(path)
+        server.faults = workers
+        server.requests = 0
+        LogDownloader(url, None, None, None, None, tmp, download_workers=workers)._download_file(url, path)
+        click.echo(
+            f"{workers} dropped connections: {server.requests} requests, intact: {matches(path)}"
+        )
+
+        # Cut the server off after half of the artifact, then run the download again
+        os.remove(path)
+        server.budget = len(payload) // 2
+        try:
+            LogDownloader(url, None, None, None, None, tmp, download_workers=workers)._download_file(url, path)
+        except SystemExit:
+            pass
+        server.budget = None
+        server.served = 0
+        LogDownloader(url, None, None, None, None, tmp, download_workers=workers)._download_file(url, path)
+        failed |= server.served >= len(payload)
+        click.echo(
+            f"resumed after an outage at 50%: fetched {server.served / len(payload):.0%} "
+            f"of the artifact again, intact: {matches(path)}"
+        )
+
+        # Servers rejecting HEAD are still downloaded, in a single stream
+        os.remove(path)
+        server.reject_head = True
+        LogDownloader(url, None, None, None, None, tmp, download_workers=workers)._download_file(url, path)
+        server.reject_head = False
+        click.echo(f"HEAD rejected, streamed: intact: {matches(path)}")
+
+        cache_dir = os.path.join(tmp, "cache")
+        for attempt in ("first", "second"):
+            server.served = 0
+            downloader = LogDownloader(
+                f"http://127.0.0.1:{server.server_port}",
+                None,
+                None,
+                None,
+                None,
+                tmp,
+                download_workers=workers,
+                artifact_cache_dir=cache_dir,
+            )
+            cached_path, _ = downloader._fetch_artifact("ingest.zip", path)
+            # The second fetch must be served from the cache
+            failed |= attempt == "second" and server.served > 0
+            click.echo(
+                f"artifact cache, {attempt} fetch: {server.served / len(payload):.0%} "
+                f"of the artifact downloaded, intact: {matches(cached_path)}"
+            )
+
+        server.sha256 = "0" * 64
+        try:
+            downloader._fetch_artifact("ingest.zip", path)
+            click.echo("corrupted artifact accepted")
+            failed = True
+        except SystemExit:
+            click.echo("corrupted artifact rejected")
+    server.shutdown()
+    if failed:
+        raise SystemExit(1)
+
+
+@cli.command("bulk-download")
+@click.option("--runs", type=click.IntRange(min=1), default=40, show_default=True)
+@click.option(
+    "--latency",
+    type=click.FloatRange(min=0),
+    default=0.05,
+    show_default=True,
+    help="Seconds the fake Artifactory waits before every response",
+)
+@click.option(
+    "--concurrency",
+    "concurrencies",
+    type=click.IntRange(min=1),
+    multiple=True,
+    default=[1, 8],
+    show_default=True,
+)
+def bulk_download(runs: int, latency: float, concurrencies: list[int]) -> None:
+    """Select and download nightly ingest zips from a local fake Artifactory."""
+    import io
+    import zipfile
+    from datetime import datetime, timedelta
+
+    from log_downloader import LogDownloader
+
+    def ingest_zip(stamp):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("builds.xlsx", f"run {stamp}")
+            zf.writestr("logs/org/repo/main/build.log", "BUILD FAILED with an exception:\n")
+        return archive.getvalue()
+
+    # Files no selection below may download: a zip without a run timestamp
+    # outside the version folders, and a log next to every zip
+    files = {"moderne-ingest/tools/ingest-log-latest.zip": ingest_zip("latest")}
+    # Name, version and date of every nightly run, oldest first
+    nightly = []
+    first_run = datetime(2024, 12, 1, 0, 22)
+    for i in range(runs):
+        run_date = first_run + timedelta(days=i)
+        stamp = run_date.strftime("%Y%m%d%H%M")
+        version = f"{i % 3 + 8}-20"
+        name = f"ingest-log-{stamp}-{i % 3 + 8}"
+        files[f"moderne-ingest/{version}/{stamp}/{name}.zip"] = ingest_zip(stamp)
+        files[f"moderne-ingest/{version}/{stamp}/{name}.log"] = b"ingest log"
+        nightly.append((name, version, run_date))
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeArtifactoryHandler)
+    server.daemon_threads = True
+    server.files = files
+    server.latency = latency
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+
+    since, until = datetime(2024, 12, 10), datetime(2024, 12, 20)
+    selections = {
+        "--latest 7": (dict(latest=7), {name for name, _, _ in nightly[-7:]}),
+        "--select '9-20/*'": (
+            dict(artifact_glob="9-20/*"),
+            {name for name, version, _ in nightly if version == "9-20"},
+        ),
+        "--since 2024-12-10 --until 2024-12-20": (
+            dict(since=since, until=until),
+            {name for name, _, run_date in nightly if since <= run_date < until},
+        ),
+    }
+    failed = False
+    for concurrency in concurrencies:
+        for label, (selection, expected) in selections.items():
+            with tempfile.TemporaryDirectory() as tmp:
+                downloader = LogDownloader(
+                    url,
+                    "moderne-ingest",
+                    None,
+                    None,
+                    None,
+                    tmp,
+                    concurrency=concurrency,
+                    **selection,
+                )
+                start = time.perf_counter()
+                downloader.download_logs()
+                elapsed = time.perf_counter() - start
+                extracted = {
+                    name
+                    for name in os.listdir(tmp)
+                    if os.path.exists(os.path.join(tmp, name, "builds.xlsx"))
+                }
+                # Downloaded zips are removed once extracted
+                extracted -= {
+                    name
+                    for name in extracted
+                    if os.path.exists(os.path.join(tmp, name, f"{name}.zip"))
+                }
+            click.echo(
+                f"concurrency {concurrency}, {label}: {len(extracted)} runs "
+                f"extracted into their own directory in {elapsed:.2f}s"
+            )
+            if extracted != expected:
+                failed = True
+                click.echo(
+                    f"  missing {sorted(expected - extracted)}, "
+                    f"unexpected {sorted(extracted - expected)}",
+                    err=True,
+                )
+    server.shutdown()
+    if failed:
+        raise SystemExit(1)
+
+
+@cli.command()
+@click.option("--rows", type=click.IntRange(min=1), default=50_000, show_default=True)
+@click.option(
+    "--extra-columns",
+    type=click.IntRange(min=0),
+    default=20,
+    show_default=True,
+    help="Columns builds.xlsx has besides the ones the analysis reads",
+)
+def manifest(rows: int, extra_columns: int) -> None:
+    """Compare parsing the whole builds.xlsx with the cached manifest columns.
+
+    Fails when a truncated cache is reused instead of parsed again.
+    """
+    import pandas as pd
+    from log_sources import DirectorySource, read_manifest
+
+    rng = np.random.default_rng(42)
+    build_tools = rng.integers(0, 4, rows)
+    df = pd.DataFrame(
+        {
+            "Path": [f"org/repo{i}" for i in range(rows)],
+            "Branch": "main",
+            "Outcome": rng.choice(["Success", "Failure"], rows),
+            "Build log": [f"org/repo{i}/main/build.log" for i in range(rows)],
+            **{
+                f"{tool} version": np.where(build_tools == t, "1.0", None)
+                for t, tool in enumerate(["Maven", "Gradle", "Bazel", "Dotnet"])
+            },
+            **{f"Column {i}": rng.random(rows) for i in range(extra_columns)},
+        }
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        df.to_excel(os.path.join(tmp, "builds.xlsx"), index=False)
+        source = DirectorySource(tmp)
+        cache_path = os.path.join(tmp, "builds_manifest.pkl")
+
+        start = time.perf_counter()
+        full = pd.read_excel(os.path.join(tmp, "builds.xlsx"))
+        click.echo(f"whole workbook: {time.perf_counter() - start:.2f}s")
+        for run in ("first run, parsed", "next run, cached"):
+            start = time.perf_counter()
+            columns, _ = read_manifest(source, cache_path)
+            click.echo(
+                f"{run}: {time.perf_counter() - start:.3f}s, "
+                f"{columns.memory_usage(deep=True).sum() / 1024**2:.1f} MB "
+                f"instead of {full.memory_usage(deep=True).sum() / 1024**2:.1f} MB"
+            )
+
+        # An interrupted write must leave a cache miss, not a crash
+        with open(cache_path, "r+b") as f:
+            f.truncate(os.path.getsize(cache_path) // 2)
+        _, cached = read_manifest(source, cache_path)
+        click.echo(f"truncated cache: {'reused' if cached else 'parsed again'}")
+        if cached:
+            raise SystemExit(1)
+
+
+@cli.command()
+@click.option("--rows", type=click.IntRange(min=100), default=50_000, show_default=True)
+@click.option("--clusters", type=click.IntRange(min=2), default=15, show_default=True)
+@click.option("--pca-components", type=click.IntRange(min=0), default=50, show_default=True)
+@click.option("--sample-size", type=click.IntRange(min=10), default=20_000, show_default=True)
+@click.option(
+    "--full/--no-full",
+    default=True,
+    show_default=True,
+    help="Also time UMAP fitted on every row of the full 384-dim embeddings",
+)
+def projection(
+    rows: int, clusters: int, pca_components: int, sample_size: int, full: bool
+) -> None:
+    """Compare the projection stage with UMAP fitted on every full-dimension row."""
+    import umap
+    from projection import Projector
+    from sklearn.manifold import trustworthiness
+
+    rng = np.random.default_rng(42)
+    centers = rng.normal(size=(clusters, 384))
+    labels = rng.integers(0, clusters, rows)
+    embeddings = (centers[labels] + rng.normal(scale=0.6, size=(rows, 384))).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    check = rng.choice(rows, size=min(rows, 2000), replace=False)
+
+    def report(label, elapsed, coordinates):
+        score = trustworthiness(embeddings[check], coordinates[check], n_neighbors=10)
+        click.echo(f"{label}: {elapsed:.1f}s, trustworthiness {score:.3f}")
+
+    start = time.perf_counter()
+    coordinates = Projector(pca_components, sample_size).fit_transform(embeddings, labels)
+    report(
+        f"PCA to {pca_components} + UMAP on {min(rows, sample_size)} sampled rows",
+        time.perf_counter() - start,
+        coordinates,
+    )
+    if full:
+        start = time.perf_counter()
+        coordinates = umap.UMAP(n_neighbors=100, min_dist=0.7, random_state=42).fit_transform(
+            embeddings
+        )
+        report("UMAP on every row", time.perf_counter() - start, coordinates)
+
+
+def synthetic_cluster_frame(rows, clusters, seed=42):
+    """Generate the clustered failures the scatter plot and logs report are rendered from."""
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    labels = rng.integers(0, clusters, rows)
+    build_types = rng.integers(0, 2, rows)
+    logs = synthetic_volatile_logs(rows)
+    return pd.DataFrame(
+        {
+            "Path": [f"org/repository-{i}" for i in range(rows)],
+            "Branch": "main",
+            "Extracted logs": logs,
+            "Signature": [log.split("\n")[0] for log in logs],
+            "Maven version": np.where(build_types == 0, "3.9.6", None),
+            "Gradle version": np.where(build_types == 1, "8.5", None),
+            "Bazel version": None,
+            "Dotnet version": None,
+            "kmeans_summary": labels,
+            "Centroid distance": rng.random(rows),
+            "x": rng.normal(labels, 0.5),
+            "y": rng.normal(labels % 4, 0.5),
+        }
+    )
+
+
+@cli.command()
+@click.option("--rows", type=click.IntRange(min=1), default=30_000, show_default=True)
+@click.option("--clusters", type=click.IntRange(min=1), default=15, show_default=True)
+@click.option(
+    "--max-points",
+    type=click.IntRange(min=1),
+    help="Also render the WebGL plot downsampled to about this many points",
+)
+def scatter(rows: int, clusters: int, max_points: Optional[int]) -> None:
+    """Compare the size of the inline and WebGL scatter plots."""
+    from build_log_analyzer import BuildLogAnalyzer
+
+    frame = synthetic_cluster_frame(rows, clusters)
+
+    renders = [("inline", None), ("webgl", None)]
+    if max_points:
+        renders.append(("webgl", max_points))
+    with tempfile.TemporaryDirectory() as output_dir:
+        for mode, points in renders:
+            analyzer = BuildLogAnalyzer(
+                output_dir, scatter_mode=mode, scatter_max_points=points
+            )
+            analyzer.data_frames = frame.copy()
+            start = time.perf_counter()
+            analyzer._create_scatter_plot()
+            elapsed = time.perf_counter() - start
+            html_size = os.path.getsize(analyzer.final_cluster_html_path)
+            sidecar = ""
+            if mode == "webgl":
+                sidecar = f", {directory_size(analyzer.scatter_data_dir) / 1024**2:.1f} MB loaded on demand"
+            label = mode + (f" with at most ~{points} points" if points else "")
+            click.echo(
+                f"{label}: {html_size / 1024**2:.1f} MB HTML{sidecar}, rendered in {elapsed:.1f}s"
+            )
+
+
+@cli.command("cluster-logs")
+@click.option("--rows", type=click.IntRange(min=1), default=30_000, show_default=True)
+@click.option("--clusters", type=click.IntRange(min=1), default=15, show_default=True)
+@click.option(
+    "--representatives", type=click.IntRange(min=1), default=25, show_default=True
+)
+def cluster_logs(rows: int, clusters: int, representatives: int) -> None:
+    """Measure the cluster logs report against embedding every failure in it."""
+    from build_log_analyzer import BuildLogAnalyzer
+
+    frame = synthetic_cluster_frame(rows, clusters)
+    # Embedding every distinct signature approximates the report before it was paginated
+    for label, count in [("representatives", representatives), ("every signature", rows)]:
+        with tempfile.TemporaryDirectory() as output_dir:
+            analyzer = BuildLogAnalyzer(output_dir, report_representatives=count)
+            analyzer.data_frames = frame.copy()
+            analyzer.data_frames["Build"] = "maven"
+            start = time.perf_counter()
+            analyzer._create_cluster_logs()
+            elapsed = time.perf_counter() - start
+            html_size = os.path.getsize(analyzer.final_logs_html_path)
+            pages_size = directory_size(analyzer.logs_data_dir)
+            click.echo(
+                f"{label}: {html_size / 1024**2:.1f} MB HTML, "
+                f"{pages_size / 1024**2:.1f} MB compressed pages, written in {elapsed:.1f}s"
+            )
+
+
+@cli.command()
+@click.option("--rows", type=click.IntRange(min=10), default=2000, show_default=True)
+@click.option("--lines", type=click.IntRange(min=0), default=2000, show_default=True)
+@click.option(
+    "--max-frame-ratio",
+    type=click.FloatRange(min=0),
+    default=0.25,
+    show_default=True,
+    help="Fail when the failures DataFrame still takes more than this fraction of the raw log size after extraction",
+)
+def memory(rows: int, lines: int, max_frame_ratio: float) -> None:
+    """Check that raw logs are released after extraction and embeddings stay one float32 matrix.
+
+    The embeddings are seeded as the embeddings.npy checkpoint of the run, so the
+    clustering and rendering stages run without the embedding model.
+    """
+    import tracemalloc
+
+    import pandas as pd
+    from build_log_analyzer import BuildLogAnalyzer
+    from checkpoints import fingerprint, mark_array_checkpoint
+
+    rng = random.Random(42)
+    problems = []
+    with tempfile.TemporaryDirectory() as tmp:
+        os.makedirs(os.path.join(tmp, "logs"))
+        manifest = []
+        for i in range(rows):
+            build_type = "maven" if i % 2 else "gradle"
+            with open(os.path.join(tmp, "logs", f"{i}.log"), "w", encoding="UTF-8") as f:
+                f.write(synthetic_build_log(rng, build_type, lines))
+            manifest.append(
+                {
+                    "Path": f"org/repo{i}",
+                    "Branch": "main",
+                    "Outcome": "Failure",
+                    "Build log": f"logs/{i}.log",
+                    "Maven version": "3.9.6" if build_type == "maven" else None,
+                    "Gradle version": "8.5" if build_type == "gradle" else None,
+                    "Bazel version": None,
+                    "Dotnet version": None,
+                }
+            )
+        pd.DataFrame(manifest).to_excel(os.path.join(tmp, "builds.xlsx"), index=False)
+
+        analyzer = BuildLogAnalyzer(
+            tmp, read_full_logs=True, umap_sample_size=500, resume=False
+        )
+        tracemalloc.start()
+        analyzer.process_failure_logs()
+        analyzer.load_failure_logs()
+        raw_bytes = analyzer.data_frames["logs"].str.len().sum()
+        analyzer.extract_failure_stacktraces()
+        analyzer.normalize_failure_signatures()
+        _, extraction_peak = tracemalloc.get_traced_memory()
+        frame_bytes = analyzer.data_frames.memory_usage(deep=True).sum()
+        click.echo(
+            f"raw logs: {raw_bytes / 1024**2:.1f} MB, failures after extraction: "
+            f"{frame_bytes / 1024**2:.1f} MB, traced peak: {extraction_peak / 1024**2:.1f} MB"
+        )
+        if "logs" in analyzer.data_frames.columns:
+            problems.append("raw logs are kept after extraction")
+        if frame_bytes > max_frame_ratio * raw_bytes:
+            problems.append(
+                f"failures take {frame_bytes / raw_bytes:.2f}x the raw logs after extraction"
+            )
+
+        row_groups, signatures = analyzer._signature_groups()
+        vectors = np.random.default_rng(42).normal(size=(len(signatures), 384))
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.save(analyzer.embeddings_path, vectors.astype(np.float32))
+        mark_array_checkpoint(
+            analyzer.embeddings_path, fingerprint(analyzer.embedding_model, signatures)
+        )
+        analyzer.resume = True
+
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        analyzer.analyze_and_visualize_clusters()
+        _, clustering_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        matrix_bytes = len(row_groups) * 384 * 4
+        click.echo(
+            f"clustering and rendering traced peak: {(clustering_peak - before) / 1024**2:.1f} MB "
+            f"(a float32 embedding per failure would take {matrix_bytes / 1024**2:.1f} MB)"
+        )
+        object_columns = [
+            column
+            for column in analyzer.data_frames.columns
+            if analyzer.data_frames[column].map(lambda value: isinstance(value, list)).any()
+        ]
+        if object_columns:
+            problems.append(f"columns of lists kept in the failures: {object_columns}")
+
+    for problem in problems:
+        click.echo(problem, err=True)
+    if problems:
+        raise SystemExit(1)
+
+
+def anonymous_rss_bytes():
+    """Resident memory of this process not backed by files, None where unavailable.
+
+    Pages of a memory-mapped .npy file are page cache the kernel reclaims under
+    pressure, and are left out.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("RssAnon:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _large_mode_peak(embeddings_path, umap_sample_size):
+    """Run the large mode clustering and projection on an embeddings file and
+    return how far they raised the peak total and anonymous RSS."""
+    from clustering import nearest_centroids, select_k
+    from instrumentation import peak_rss_bytes
+    from projection import Projector
+
+    anonymous_before = anonymous_rss_bytes()
+    anonymous_peak = anonymous_before
+    done = threading.Event()
+
+    def sample():
+        nonlocal anonymous_peak
+        while not done.wait(0.005):
+            anonymous_peak = max(anonymous_peak, anonymous_rss_bytes())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    if anonymous_before is not None:
+        sampler.start()
+    peak_before = peak_rss_bytes()
+    try:
+        labels, centers, _ = select_k(
+            embeddings_path,
+            k_min=3,
+            k_max=6,
+            workers=1,
+            sample_size=2000,
+            chunk_size=8192,
+        )
+        embeddings = np.load(embeddings_path, mmap_mode="r")
+        nearest_centroids(embeddings, centers)
+        Projector(sample_size=umap_sample_size).fit_transform(embeddings, labels)
+    finally:
+        done.set()
+    if anonymous_before is not None:
+        sampler.join()
+        anonymous_peak = max(anonymous_peak, anonymous_rss_bytes()) - anonymous_before
+    else:
+        anonymous_peak = None
+    return peak_rss_bytes() - peak_before, anonymous_peak
+
+
+@cli.command("large-mode")
+@click.option(
+    "--rows",
+    "row_counts",
+    type=click.IntRange(min=1000),
+    multiple=True,
+    default=[20_000, 100_000],
+    show_default=True,
+    help="Row counts to compare, larger than the 8192 rows read per chunk",
+)
+@click.option(
+    "--umap-sample-size", type=click.IntRange(min=10), default=2000, show_default=True
+)
+@click.option(
+    "--max-growth",
+    type=click.FloatRange(min=0),
+    default=0.1,
+    show_default=True,
+    help="Largest allowed increase of the peak RSS per byte the embedding matrix grows",
+)
+def large_mode(row_counts: list[int], umap_sample_size: int, max_growth: float) -> None:
+    """Check that the peak RSS of large mode clustering stays flat as rows grow.
+
+    Each row count runs in a fresh process on a memory-mapped embeddings file.
+    Pages of the file count towards the total RSS while mapped, so the check is
+    made on the anonymous RSS where the platform reports it.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    row_counts = sorted(row_counts)
+    peaks = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in row_counts:
+            path = os.path.join(tmp, f"embeddings-{rows}.npy")
+            rng = np.random.default_rng(42)
+            centers = rng.normal(size=(8, 384)).astype(np.float32)
+            embeddings = np.lib.format.open_memmap(
+                path, mode="w+", dtype=np.float32, shape=(rows, 384)
+            )
+            for start in range(0, rows, 8192):
+                count = min(8192, rows - start)
+                chunk = centers[rng.integers(0, len(centers), count)] + rng.normal(
+                    scale=0.3, size=(count, 384)
+                )
+                embeddings[start : start + count] = chunk / np.linalg.norm(
+                    chunk, axis=1, keepdims=True
+                )
+            embeddings.flush()
+            del embeddings
+
+            start = time.perf_counter()
+            with ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn")
+            ) as executor:
+                total, anonymous = executor.submit(
+                    _large_mode_peak, path, umap_sample_size
+                ).result()
+            elapsed = time.perf_counter() - start
+            os.remove(path)
+            peaks[rows] = anonymous if anonymous is not None else total
+            click.echo(
+                f"{rows} rows ({rows * 384 * 4 / 1024**2:.0f} MB of embeddings): "
+                f"peak RSS +{total / 1024**2:.1f} MB"
+                + (
+                    f", anonymous +{anonymous / 1024**2:.1f} MB"
+                    if anonymous is not None
+                    else ""
+                )
+                + f" in {elapsed:.1f}s"
+            )
+
+    if len(row_counts) < 2:
+        return
+    growth = peaks[row_counts[-1]] - peaks[row_counts[0]]
+    matrix_growth = (row_counts[-1] - row_counts[0]) * 384 * 4
+    click.echo(
+        f"peak RSS grew {growth / 1024**2:.1f} MB while the embeddings grew "
+        f"{matrix_growth / 1024**2:.0f} MB ({growth / matrix_growth:.1%})"
+    )
+    if growth > max_growth * matrix_growth:
+        click.echo(
+            f"peak RSS grows more than {max_growth:.0%} of the embedding matrix", err=True
+        )
+        raise SystemExit(1)
+
+
+@cli.command()
+@click.option("--signatures", type=click.IntRange(min=1), default=30_000, show_default=True)
+@click.option(
+    "--failures-per-signature", type=click.IntRange(min=1), default=3, show_default=True
+)
+@click.option("--top-k", type=click.IntRange(min=1), default=5, show_default=True)
+@click.option("--queries", type=click.IntRange(min=1), default=100, show_default=True)
+def query(signatures: int, failures_per_signature: int, top_k: int, queries: int) -> None:
+    """Measure opening the failure index and looking up the most similar failures."""
+    from vector_index import VectorIndex, save_index
+
+    rng = np.random.default_rng(42)
+    vectors = rng.normal(size=(signatures, 384)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    rows = signatures * failures_per_signature
+    with tempfile.TemporaryDirectory() as model_dir:
+        embeddings_path = os.path.join(model_dir, "embeddings.npy")
+        np.save(embeddings_path, vectors)
+        save_index(
+            model_dir,
+            embeddings_path,
+            [f"org/repo{i}" for i in range(rows)],
+            ["main"] * rows,
+            rng.integers(0, 15, rows).tolist(),
+            rng.permutation(np.arange(rows) % signatures).tolist(),
+        )
+
+        start = time.perf_counter()
+        index = VectorIndex(model_dir)
+        click.echo(
+            f"opened an index of {len(index)} failures in "
+            f"{(time.perf_counter() - start) * 1000:.1f} ms"
+        )
+        start = time.perf_counter()
+        for query_vector in vectors[rng.integers(0, signatures, queries)]:
+            index.search(query_vector, top_k)
+        click.echo(
+            f"top-{top_k} lookup: {(time.perf_counter() - start) * 1000 / queries:.2f} ms per query"
+        )
+
+
+HEAVY_MODULES = ["torch", "transformers", "umap", "sklearn", "plotly"]
+
+
+@cli.command()
+@click.option("--repeat", type=click.IntRange(min=1), default=3, show_default=True)
+def startup(repeat: int) -> None:
+    """Time each analyze_logs.py subcommand up to its first exit, and list the heavy modules it imported."""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "analyze_logs.py")
+    runner = (
+        "import runpy, sys\n"
+        "sys.argv = sys.argv[1:]\n"
+        "try:\n"
+        "    runpy.run_path(sys.argv[0], run_name='__main__')\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        f"print('imported:', *(m for m in {HEAVY_MODULES!r} if m in sys.modules), file=sys.stderr)\n"
+    )
+    with tempfile.TemporaryDirectory() as empty_dir:
+        commands = {
+            "--help": ["--help"],
+            "download --help": ["download", "--help"],
+            "analyze --help": ["analyze", "--help"],
+            "assign --help": ["assign", "--help"],
+            # Fails on the missing failures.csv before any model is needed
+            "analyze without failures.csv": [
+                "analyze",
+                empty_dir,
+                "--skip-process-failure-logs",
+                "--no-cache",
+            ],
+        }
+        for label, args in commands.items():
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                result = subprocess.run(
+                    [sys.executable, "-c", runner, script, *args],
+                    capture_output=True,
+                    text=True,
+                )
+                timings.append(time.perf_counter() - start)
+            heavy = result.stderr.strip().splitlines()[-1].removeprefix("imported:").strip()
+            click.echo(
+                f"{label}: {min(timings):.2f}s, heavy modules imported: {heavy or 'none'}"
+            )
+
+
+if __name__ == "__main__":
+    cli()
@@ -1,17 +1,53 @@
+import json
 import os
-import re
+import pickle
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import click
+import log_extractors
+import log_sources
+import numpy as np
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-import torch
-import umap
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score
-from tqdm import tqdm
-from transformers import AutoModel, AutoTokenizer
-import sys
+from checkpoints import (
+    array_checkpoint_is_current,
+    file_fingerprint,
+    fingerprint,
+    invalidate_array_checkpoint,
+    load_checkpoint,
+    mark_array_checkpoint,
+    save_checkpoint,
+)
+from embedder import (
+    EMBEDDING_DIM,
+    MODEL_ID,
+    clean_input,
+    create_embedder,
+    embedding_model,
+)
+from cluster_report import (
+    REPORT_COLUMNS,
+    cluster_logs_post_script,
+    cluster_members,
+    table_columns,
+    write_member_pages,
+)
+from embedding_cache import EmbeddingCache
+from instrumentation import RunReport, instrumented
+from log_extractors import extract_stacktraces
+from log_sources import open_source, read_manifest
+from projection import UMAP_SAMPLE_SIZE, Projector, project
+from scatter import (
+    INLINE_POST_SCRIPT,
+    density_sample,
+    webgl_post_script,
+    write_hover_payloads,
+)
+from signatures import normalize_signature
+from utils import directory_size
+from vector_index import save_index
+
 
 def get_build_type(row):
     if not pd.isna(row["Maven version"]):
@@ -42,103 +78,459 @@ def wrap_line(text, max_len=200, max_lines=8):
 
 
 class BuildLogAnalyzer:
-    def __init__(self, output_dir="output"):
-        self.tokenizer = AutoTokenizer.from_pretrained("BAAI/bge-small-en-v1.5")
-        self.model = AutoModel.from_pretrained("BAAI/bge-small-en-v1.5")
-        self.model.eval()
+    def __init__(
+        self,
+        output_dir="output",
+        logs_source=None,
+        batch_size=32,
+        cache_dir=None,
+        cache_max_entries=200_000,
+        use_cache=True,
+        sweep_workers=None,
+        silhouette_sample_size=10_000,
+        sweep_patience=None,
+        clustering_mode="standard",
+        chunk_size=8192,
+        io_workers=16,
+        read_full_logs=False,
+        extract_workers=1,
+        embedding_backend="torch",
+        embedding_threads=None,
+        embedding_workers=1,
+        normalize_signatures=True,
+        pca_components=50,
+        umap_sample_size=UMAP_SAMPLE_SIZE,
+        reuse_projection=False,
+        scatter_mode="inline",
+        scatter_max_points=None,
+        report_representatives=25,
+        profile=False,
+        resume=True,
+    ):
+        # torch, transformers, sklearn, umap and plotly are imported by the stages
+        # that use them, and the model is loaded on the first embedding
+        self._embedder = None
+        self.batch_size = batch_size
+        self.model_id = MODEL_ID
+        self.embedding_backend = embedding_backend
+        self.embedding_threads = embedding_threads
+        self.embedding_workers = embedding_workers
+        self.normalize_signatures = normalize_signatures
+        self.pca_components = pca_components
+        self.umap_sample_size = umap_sample_size
+        self.reuse_projection = reuse_projection
+        self.resume = resume
+        self.scatter_mode = scatter_mode
+        self.scatter_max_points = scatter_max_points
+        self.report_representatives = report_representatives
+        self.onnx_dir = os.path.join(cache_dir or output_dir, "onnx")
         self.random_state = 42
+        self.sweep_workers = sweep_workers
+        self.silhouette_sample_size = silhouette_sample_size
+        self.sweep_patience = sweep_patience
+        self.clustering_mode = clustering_mode
+        self.chunk_size = chunk_size
+        self.io_workers = io_workers
+        self.read_full_logs = read_full_logs
+        self.extract_workers = extract_workers
         self.data_frames: pd.DataFrame | None = None
 
         self.output_dir = output_dir
-        self.build_manifest_path = os.path.join(output_dir, "builds.xlsx")
+        # Logs and builds.xlsx are read in place, from a directory or an ingest zip
+        self.source = open_source(logs_source or output_dir)
+        # int8 vectors differ slightly, keep them apart from full precision ones
+        self.embedding_model = embedding_model(self.model_id, embedding_backend)
+        self.embedding_cache = (
+            EmbeddingCache(cache_dir or output_dir, self.embedding_model, cache_max_entries)
+            if use_cache
+            else None
+        )
         self.failures_path = os.path.join(output_dir, "failures.csv")
+        self.manifest_cache_path = os.path.join(output_dir, "builds_manifest.pkl")
+        # Checkpoints of the stages, see checkpoints.py
+        self.extracted_logs_path = os.path.join(output_dir, "extracted_logs.pkl")
+        self.embeddings_path = os.path.join(output_dir, "embeddings.npy")
+        self.clusters_path = os.path.join(output_dir, "clusters.pkl")
+        self.projection_path = os.path.join(output_dir, "projection.pkl")
+        self.projector_path = os.path.join(output_dir, "projector.pkl")
+        self.model_dir = os.path.join(output_dir, "model")
         self.final_cluster_html_path = os.path.join(output_dir, "clusters_scatter.html")
+        # Timing, memory and throughput of every stage, see instrumentation.py
+        self.report = RunReport(
+            os.path.join(output_dir, "run_report.json"),
+            os.path.join(output_dir, "slowest_stage.prof") if profile else None,
+        )
+        # Tooltip payloads of the WebGL scatter plot, loaded by the page on demand
+        self.scatter_data_dir = os.path.join(output_dir, "clusters_scatter_data")
         self.final_logs_html_path = os.path.join(output_dir, "clusters_logs.html")
+        # Every failure of each cluster, loaded by the logs report on demand
+        self.logs_data_dir = os.path.join(output_dir, "clusters_logs_data")
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            self._embedder = create_embedder(
+                self.embedding_backend,
+                workers=self.embedding_workers,
+                model_id=self.model_id,
+                batch_size=self.batch_size,
+                threads=self.embedding_threads,
+                onnx_dir=self.onnx_dir,
+            )
+        return self._embedder
+
+    def close(self):
+        """Release the embedder, stopping its worker processes if it has any."""
+        if self._embedder is not None:
+            self._embedder.close()
+            self._embedder = None
 
     def get_embedding(self, input_string):
-        if input_string is None or not isinstance(input_string, str):
-            # Return zeros for invalid input
-            return [0.0] * 384  # BGE-small model has 384 dimensions
-
-        # Clean input string
-        cleaned_input = str(input_string).strip()
-        if not cleaned_input:
-            return [0.0] * 384
-
-        with torch.no_grad():
-            encoded_input = self.tokenizer(
-                [cleaned_input], padding=True, truncation=True, return_tensors="pt"
+        return self.embedder.embed_one(input_string)
+
+    @instrumented("embedding")
+    def get_embeddings(self, input_strings):
+        self.report.record(rows=len(input_strings))
+        if self.embedding_cache is None:
+            return self.embedder.embed(input_strings)
+
+        cache = self.embedding_cache
+        hits, misses = cache.hits, cache.misses
+        embeddings = np.zeros((len(input_strings), EMBEDDING_DIM), dtype=np.float32)
+        row_keys = {}
+        new_inputs = {}
+        for idx, input_string in enumerate(input_strings):
+            cleaned_input = clean_input(input_string)
+            if cleaned_input:
+                row_keys[idx] = cache.key(cleaned_input)
+                new_inputs[row_keys[idx]] = cleaned_input
+
+        vectors = cache.get_many(new_inputs.keys())
+        for key in vectors:
+            del new_inputs[key]
+        if new_inputs:
+            new_embeddings = self.embedder.embed(list(new_inputs.values()))
+            new_vectors = dict(zip(new_inputs.keys(), new_embeddings))
+            cache.put_many(new_vectors)
+            vectors.update(new_vectors)
+
+        for idx, key in row_keys.items():
+            embeddings[idx] = vectors[key]
+        self.report.record(cache_hits=cache.hits - hits, cache_misses=cache.misses - misses)
+        click.echo(
+            f"Embedding cache: {cache.hits} hits, {cache.misses} misses "
+            f"({click.format_filename(cache.path)})"
+        )
+        return embeddings
+
+    def _signature_groups(self):
+        """Return the signature group of every row and the distinct signatures."""
+        row_groups, signatures = pd.factorize(self.data_frames["Signature"])
+        return row_groups, signatures.tolist()
+
+    def _max_clusters(self, signatures):
+        kmax = min(20, len(signatures) - 1)
+        assert kmax >= 3, (
+            f"At least 4 distinct failure signatures are needed, found {len(signatures)}."
+        )
+        return kmax
+
+    @instrumented("projection")
+    def _project(self, embeddings, labels, row_groups):
+        """Set the x/y scatter coordinates of every row, pickling the projector to
+        `projector_path`."""
+        projector = Projector(
+            pca_components=self.pca_components,
+            sample_size=self.umap_sample_size,
+            chunk_size=self.chunk_size,
+            random_state=self.random_state,
+        )
+        coordinates, how = project(
+            projector,
+            embeddings,
+            labels,
+            self.projection_path,
+            self.projector_path,
+            self.reuse_projection,
+            self.resume,
+        )
+        click.echo(
+            f"Projection {how} ({click.format_filename(self.projection_path)})"
+        )
+        self.report.record(
+            rows=len(embeddings),
+            cache_hits=int(how != "fitted"),
+            cache_misses=int(how == "fitted"),
+        )
+        self.data_frames["x"] = coordinates[row_groups, 0]
+        self.data_frames["y"] = coordinates[row_groups, 1]
+
+    def _embed_signatures(self, signatures):
+        """Write the embeddings of the distinct signatures to embeddings.npy, unless a
+        previous run already did, and return their fingerprint."""
+        key = fingerprint(self.embedding_model, signatures)
+        if self.resume and array_checkpoint_is_current(self.embeddings_path, key):
+            click.echo(
+                f"Resuming from the embeddings in {click.format_filename(self.embeddings_path)}"
+            )
+            return key
+
+        invalidate_array_checkpoint(self.embeddings_path)
+        if self.clustering_mode == "large":
+            embeddings = np.lib.format.open_memmap(
+                self.embeddings_path,
+                mode="w+",
+                dtype=np.float32,
+                shape=(len(signatures), EMBEDDING_DIM),
             )
-            model_output = self.model(**encoded_input)
-            embedding = model_output[0][:, 0]
-            embedding = torch.nn.functional.normalize(embedding, p=2, dim=1)[0]
-            return embedding.tolist()
+            for start in range(0, len(signatures), self.chunk_size):
+                chunk = signatures[start : start + self.chunk_size]
+                embeddings[start : start + len(chunk)] = self.get_embeddings(chunk)
+            embeddings.flush()
+            del embeddings
+        else:
+            np.save(self.embeddings_path, self.get_embeddings(signatures))
+        mark_array_checkpoint(self.embeddings_path, key)
+        return key
+
+    def _select_clusters(self, embeddings, embeddings_key, row_groups, kmax):
+        """Return the labels, centroids and scores of the best cluster count, reusing
+        the ones of a previous run with the same embeddings and sweep parameters."""
+        import clustering
+
+        large = self.clustering_mode == "large"
+        key = fingerprint(
+            embeddings_key,
+            np.bincount(row_groups),
+            kmax,
+            self.clustering_mode,
+            self.chunk_size if large else None,
+            self.silhouette_sample_size,
+            self.sweep_patience,
+            self.random_state,
+            file_fingerprint(clustering.__file__),
+        )
+        clusters = load_checkpoint(self.clusters_path, key) if self.resume else None
+        if clusters is not None:
+            click.echo(
+                f"Resuming from the clusters in {click.format_filename(self.clusters_path)}"
+            )
+            return clusters
+
+        with self.report.stage("kmeans_sweep"):
+            self.report.record(rows=len(embeddings))
+            clusters = clustering.select_k(
+                self.embeddings_path if large else embeddings,
+                k_min=3,
+                k_max=kmax,
+                workers=self.sweep_workers,
+                sample_size=self.silhouette_sample_size,
+                patience=self.sweep_patience,
+                random_state=self.random_state,
+                chunk_size=self.chunk_size if large else None,
+                row_groups=row_groups,
+            )
+        click.echo(
+            f"Selected k={len(set(clusters[0]))} after evaluating {len(clusters[2])} candidates"
+        )
+        save_checkpoint(self.clusters_path, key, clusters)
+        return clusters
+
+    def _embed_summaries_cluster(self, mmap_mode=None):
+        """Embed the distinct signatures, cluster them and project them to 2D.
+
+        Embeddings are read from the embeddings.npy checkpoint as one float32
+        matrix that KMeans, silhouette scoring and the projection read without
+        copies per row. With `mmap_mode`, as in large mode, the matrix is
+        memory-mapped instead: it is written chunk by chunk, KMeans is fitted
+        incrementally over the chunks and the projection is fitted on a sample
+        before transforming every chunk.
+        """
+        df = self.data_frames
+        row_groups, signatures = self._signature_groups()
+        kmax = self._max_clusters(signatures)
+
+        # One row per distinct signature
+        embeddings_key = self._embed_signatures(signatures)
+        embeddings = np.load(self.embeddings_path, mmap_mode=mmap_mode)
+
+        best_kmeans, centers, scores = self._select_clusters(
+            embeddings, embeddings_key, row_groups, kmax
+        )
+        df["kmeans_summary"] = best_kmeans[row_groups]
+        self.data_frames = df
 
-    def _embed_summaries_cluster(self):
+        self._project(embeddings, best_kmeans, row_groups)
+        self._save_model(embeddings, centers, row_groups)
+
+    @instrumented("save_model")
+    def _save_model(self, embeddings, centers, row_groups):
+        """Persist what `assign` and `query` need to place new failures into these clusters."""
+        from clustering import nearest_centroids
+
+        os.makedirs(self.model_dir, exist_ok=True)
+        _, distances = nearest_centroids(embeddings, centers, self.chunk_size)
+        # Distances of the original rows, as assign measures them
+        distances = distances[row_groups]
+        # Also ranks the failures of each cluster in the logs report
+        self.data_frames["Centroid distance"] = distances
+        np.save(
+            os.path.join(self.model_dir, "centroids.npy"), centers.astype(np.float32)
+        )
+        shutil.copyfile(self.projector_path, os.path.join(self.model_dir, "umap.pkl"))
+        # Nearest-neighbour index searched by the query subcommand
         df = self.data_frames
+        save_index(
+            self.model_dir,
+            self.embeddings_path,
+            df["Path"].tolist(),
+            df["Branch"].fillna("").astype(str).tolist(),
+            df["kmeans_summary"].tolist(),
+            row_groups.tolist(),
+        )
+        with open(os.path.join(self.model_dir, "model.json"), "w") as model_file:
+            json.dump(
+                {
+                    "model_id": self.model_id,
+                    "embedding_model": self.embedding_model,
+                    "normalize_signatures": self.normalize_signatures,
+                    "k": len(centers),
+                    "p95_distance": float(np.percentile(distances, 95)),
+                },
+                model_file,
+                indent=2,
+            )
+        click.echo(f"Cluster model saved to {click.format_filename(self.model_dir)}")
 
-        # Clean and validate extracted logs
-        df["Extracted logs"] = df["Extracted logs"].apply(
-            lambda x: str(x).strip() if pd.notna(x) else ""
+    def assign_to_clusters(self, model_dir, drift_threshold=1.25):
+        """Assign failures to the clusters of a previous analysis instead of reclustering.
+
+        Each failure goes to its nearest saved centroid and is placed with the saved
+        UMAP transform, so cluster IDs and the scatter layout stay comparable across
+        runs. When the 95th percentile of the assignment distances exceeds the one
+        seen when the clusters were fitted by more than `drift_threshold` times, the
+        failures are reclustered from scratch instead.
+        """
+        from clustering import nearest_centroids
+
+        df = self.data_frames
+        saved_model_dir = os.path.join(model_dir, "model")
+        with open(os.path.join(saved_model_dir, "model.json")) as model_file:
+            model = json.load(model_file)
+        fitted_on = model.get("embedding_model", model["model_id"])
+        if fitted_on != self.embedding_model:
+            raise click.ClickException(
+                f"Clusters in {model_dir} were fitted on {fitted_on} embeddings, "
+                f"not {self.embedding_model}, use the embedding backend they were fitted with"
+            )
+        fitted_normalized = model.get("normalize_signatures", True)
+        if fitted_normalized != self.normalize_signatures:
+            hint = "without" if fitted_normalized else "with"
+            raise click.ClickException(
+                f"Clusters in {model_dir} were fitted on "
+                f"{'normalized' if fitted_normalized else 'raw'} signatures, "
+                f"run {hint} --no-normalize-signatures"
+            )
+        centers = np.load(os.path.join(saved_model_dir, "centroids.npy"))
+        with open(os.path.join(saved_model_dir, "umap.pkl"), "rb") as reducer_file:
+            reducer = pickle.load(reducer_file)
+
+        row_groups, signatures = self._signature_groups()
+        embeddings = self.get_embeddings(signatures)
+        with self.report.stage("assignment"):
+            self.report.record(rows=len(signatures))
+            labels, distances = nearest_centroids(embeddings, centers, self.chunk_size)
+            labels = labels[row_groups]
+            distances = distances[row_groups]
+
+        p95_distance = float(np.percentile(distances, 95))
+        if model["p95_distance"] > 0:
+            drift = p95_distance / model["p95_distance"]
+        else:
+            # Most fitted rows sat on their centroid, any distance at all is drift
+            drift = float("inf") if p95_distance > 0 else 1.0
+        if drift > drift_threshold:
+            if drift == float("inf"):
+                click.echo(
+                    "Assignment distances are nonzero while the 95th percentile of "
+                    "the saved clusters is 0, reclustering all failures"
+                )
+            else:
+                click.echo(
+                    f"Assignment distances drifted {drift:.2f}x past the saved clusters, "
+                    "reclustering all failures"
+                )
+            self.analyze_and_visualize_clusters()
+            return
+        click.echo(
+            f"Assigned {len(df)} failures to {model['k']} saved clusters "
+            f"(distance drift {drift:.2f}x)"
         )
 
-        # Get embeddings
-        embds_summaries = [
-            self.get_embedding(summary) for summary in tqdm(df["Extracted logs"], dynamic_ncols=True, leave=False, file=sys.stdout)
-        ]
-        df["embds_summaries"] = embds_summaries
-
-        best_silhouette_score = -100
-        kmax = 20
-        assert kmax < len(df), (
-            f"Number of clusters ({kmax}) must be lower than number of rows ({len(df)})."
-        )
-
-        best_kmeans = None
-        for k in range(3, kmax + 1):
-            kmeans = KMeans(
-                n_clusters=k, n_init=10, random_state=self.random_state
-            ).fit_predict(embds_summaries)
-            score = silhouette_score(embds_summaries, kmeans, metric="euclidean")
-            if score > best_silhouette_score:
-                best_silhouette_score = score
-                best_kmeans = kmeans
-
-        df["kmeans_summary"] = best_kmeans
-
-        n_neighbors = 100 if len(df) > 100 else len(df) - 1
-        indices = umap.UMAP(
-            n_neighbors=n_neighbors, min_dist=0.7, random_state=self.random_state
-        ).fit_transform(embds_summaries)
+        df["kmeans_summary"] = labels
+        df["Centroid distance"] = distances
+        with self.report.stage("projection"):
+            self.report.record(rows=len(embeddings))
+            indices = reducer.transform(embeddings)[row_groups]
         df["x"] = indices[:, 0]
         df["y"] = indices[:, 1]
-
         self.data_frames = df
 
+        if os.path.abspath(saved_model_dir) != os.path.abspath(self.model_dir):
+            shutil.copytree(saved_model_dir, self.model_dir, dirs_exist_ok=True)
+        self._create_scatter_plot()
+        self._create_cluster_logs()
+
+    @instrumented("scatter_plot")
     def _create_scatter_plot(self):
+        import plotly.express as px
+
         df = self.data_frames
-        best_k = df["kmeans_summary"].nunique()
+        # Saved clusters may receive no new failures, keep their IDs regardless
+        best_k = df["kmeans_summary"].max() + 1
         df["Cluster label"] = pd.Categorical(
             df["kmeans_summary"].astype(str),
             categories=[str(i) for i in range(best_k)],
             ordered=True,
         )
         df["Build"] = df.apply(lambda row: get_build_type(row), axis=1)
-        df["Extracted logs"] = df["Extracted logs"].apply(
-            lambda row: wrap_line(str(row))
+        # Wrapped for the tooltips only, the logs report shows the full extracted logs
+        points = df.assign(
+            **{"Extracted logs": df["Extracted logs"].apply(lambda row: wrap_line(str(row)))}
         )
+        if self.scatter_max_points and len(df) > self.scatter_max_points:
+            points = points.iloc[
+                density_sample(
+                    df["x"],
+                    df["y"],
+                    df["kmeans_summary"],
+                    self.scatter_max_points,
+                    random_state=self.random_state,
+                )
+            ]
+            click.echo(f"Scatter plot shows {len(points)} of {len(df)} failures")
 
+        # The WebGL plot only embeds a point id, its tooltip loads the rest by id
+        webgl = self.scatter_mode == "webgl"
+        if webgl:
+            points = points.assign(**{"Point id": np.arange(len(points))})
         fig = px.scatter(
-            df,
+            points,
             x="x",
             y="y",
-            hover_data={
-                "x": False,
-                "y": False,
-                "Path": True,
-                "Branch": True,
-                "Extracted logs": True,
-            },
+            hover_data=(
+                {"x": False, "y": False}
+                if webgl
+                else {
+                    "x": False,
+                    "y": False,
+                    "Path": True,
+                    "Branch": True,
+                    "Extracted logs": True,
+                }
+            ),
+            custom_data=["Point id"] if webgl else None,
+            render_mode="webgl" if webgl else "auto",
             symbol="Build",
             color="Cluster label",
             category_orders={"Cluster label": [str(i) for i in range(best_k)]},
@@ -150,89 +542,21 @@ class BuildLogAnalyzer:
                 "unknown/other": "cross",
             },
         )
-        # Define the post_script as a triple-quoted JavaScript string
-        post_script = """
-    document.addEventListener('DOMContentLoaded', function() {
-    // Remove the 'user-select-none' class from any elements that have it
-    var elements = document.getElementsByClassName('user-select-none');
-    while (elements.length > 0) {
-        elements[0].classList.remove('user-select-none');
-    }
-
-    // Variable to hold the pinned tooltip element
-    var pinnedTooltip = null;
-    // Select the Plotly graph element by its class (assumes only one exists)
-    var plot = document.querySelector(".plotly-graph-div");
-    
-    if (plot) {
-        // Listen for Plotly's click event on data points
-        plot.on('plotly_click', function(eventData) {
-            // Remove any existing pinned tooltip
-            if (pinnedTooltip) {
-                pinnedTooltip.remove();
-            }
-            // Create a new tooltip element
-            pinnedTooltip = document.createElement("div");
-            pinnedTooltip.style.position = "absolute";
-            // Mimic Plotly's hover label style
-            pinnedTooltip.style.backgroundColor = "rgba(255, 255, 255, 0.85)";
-            pinnedTooltip.style.border = "1px solid #ccc";
-            pinnedTooltip.style.borderRadius = "3px";
-            pinnedTooltip.style.padding = "4px 8px";
-            pinnedTooltip.style.boxShadow = "0 2px 4px rgba(0,0,0,0.1)";
-            pinnedTooltip.style.fontFamily = "inherit";
-            pinnedTooltip.style.fontSize = "12px";
-            pinnedTooltip.style.color = "#2a3f5f";
-            pinnedTooltip.style.userSelect = "text";
-            pinnedTooltip.style.zIndex = 100;
-            
-            // Format the content similar to your hovertemplate:
-            // "Cluster label=19<br>Build=maven<br>Path=%{customdata[0]}<br>Branch=%{customdata[1]}<br>Extracted logs=%{customdata[2]}"
-            var point = eventData.points[0];
-            var content = "";
-            // Assuming point.data.name is like "19, maven"
-            if (point.data && point.data.name) {
-                var parts = point.data.name.split(",");
-                content += "Cluster label=" + parts[0].trim() + "<br>";
-                content += "Build=" + (parts[1] ? parts[1].trim() : "") + "<br>";
-            }
-            if (point.customdata) {
-                content += "Path=" + point.customdata[0] + "<br>";
-                content += "Branch=" + point.customdata[1] + "<br>";
-                content += "Extracted logs=" + point.customdata[2];
-            } else {
-                // Fallback if no customdata
-                content += "X: " + point.x + "<br>Y: " + point.y;
-            }
-            pinnedTooltip.innerHTML = content;
-            
-            // Position the tooltip near the pointer with an offset (to mimic hover positioning)
-            var offset = 10;
-            pinnedTooltip.style.left = (eventData.event.clientX + offset) + "px";
-            pinnedTooltip.style.top  = (eventData.event.clientY + offset) + "px";
-            
-            // Add the tooltip to the document body
-            document.body.appendChild(pinnedTooltip);
-        });
-    }
-
-    // Remove the tooltip if clicking outside of the tooltip and plot
-    document.addEventListener('click', function(e) {
-        if (pinnedTooltip && !pinnedTooltip.contains(e.target) && !plot.contains(e.target)) {
-            pinnedTooltip.remove();
-            pinnedTooltip = null;
-        }
-    });
-
-    // Remove the tooltip when pressing the Escape key
-    document.addEventListener('keydown', function(e) {
-        if (e.key === 'Escape' && pinnedTooltip) {
-            pinnedTooltip.remove();
-            pinnedTooltip = null;
-        }
-    });
-});
-"""
+        # Pins a selectable tooltip to the clicked point
+        post_script = INLINE_POST_SCRIPT
+
+        if webgl:
+            fig.update_traces(
+                hovertemplate="%{fullData.name}<br>Click for the log<extra></extra>"
+            )
+            write_hover_payloads(
+                points[["Path", "Branch", "Extracted logs"]]
+                .fillna("")
+                .astype(str)
+                .values.tolist(),
+                self.scatter_data_dir,
+            )
+            post_script = webgl_post_script(os.path.basename(self.scatter_data_dir))
 
         # Write the Plotly figure to an HTML file with the custom post_script injected
         fig.write_html(
@@ -245,41 +569,52 @@ class BuildLogAnalyzer:
         click.echo(
             f"Scatter plot analysis saved to {click.format_filename(self.final_cluster_html_path)}"
         )
+        written = os.path.getsize(self.final_cluster_html_path)
+        if webgl:
+            written += directory_size(self.scatter_data_dir)
+        self.report.record(rows=len(points), bytes=written)
 
+    @instrumented("cluster_logs")
     def _create_cluster_logs(self):
+        """Write the report of each cluster's failures nearest to its centroid.
+
+        Rows are grouped by cluster in a single pass. Only the `report_representatives`
+        nearest distinct signatures of each cluster are embedded in the report, with
+        the number of failures sharing them. All members are written to compressed
+        pages of `logs_data_dir` that the report loads on demand.
+        """
+        import plotly.graph_objects as go
+
         df = self.data_frames
-        best_k = df["kmeans_summary"].nunique()
+        best_k = df["kmeans_summary"].max() + 1
+        counts = np.bincount(df["kmeans_summary"], minlength=best_k)
 
-        def create_dropdown_options(data, cluster_id):
-            samples = data[data["Cluster label"] == str(cluster_id)][["Path", "Build", "Extracted logs"]]
-            return [
-                {
-                    "Path": row["Path"],
-                    "Build": row["Build"],
-                    "Extracted logs": str(row["Extracted logs"]).replace("\n", "<br>")
-                }
-                for _, row in samples.iterrows()
-            ]
+        members = cluster_members(df)
+        representatives = members.drop_duplicates(["kmeans_summary", "Signature"])
+        representatives = representatives.groupby("kmeans_summary").head(
+            self.report_representatives
+        )
+        tables = {cluster_id: [[], [], [], []] for cluster_id in range(best_k)}
+        for cluster_id, cluster in representatives.groupby("kmeans_summary"):
+            tables[cluster_id] = table_columns(cluster)
+        # Saved clusters may receive no failures when assigning, they still get a page
+        pages = {cluster_id: [[], [], [], []] for cluster_id in range(best_k)}
+        for cluster_id, cluster in members.groupby("kmeans_summary"):
+            pages[cluster_id] = table_columns(cluster)
+        write_member_pages(pages, self.logs_data_dir)
 
-        dropdowns = [
-            create_dropdown_options(df, str(cluster_id)) for cluster_id in range(best_k)
-        ]
         sample_figs = []
 
         for cluster_id in range(best_k):
             sample_fig = go.Figure(
                 data=[
                     go.Table(
-                        columnwidth=[80, 20, 400],  # Adjust column widths
+                        columnwidth=[20, 80, 20, 400],  # Adjust column widths
                         header=dict(
-                            values=["Path", "Build", "Extracted logs"], fill_color="paleturquoise", align="left"
+                            values=REPORT_COLUMNS, fill_color="paleturquoise", align="left"
                         ),
                         cells=dict(
-                            values=[
-                                [item["Path"] for item in dropdowns[cluster_id]],
-                                [item["Build"] for item in dropdowns[cluster_id]],
-                                [item["Extracted logs"] for item in dropdowns[cluster_id]],
-                            ],
+                            values=tables[cluster_id],
                             fill_color="lavender",
                             align="left",
                             height=30,
@@ -291,7 +626,7 @@ class BuildLogAnalyzer:
 
         dropdown_buttons = [
             {
-                "label": f"Logs for cluster ID {cluster_id}. Total Count : {len(df[df['Cluster label'] == str(cluster_id)])}",
+                "label": f"Logs for cluster ID {cluster_id}. Total Count : {counts[cluster_id]}",
                 "method": "update",
                 "args": [
                     {"visible": [str(i) == str(cluster_id) for i in range(best_k)]}
@@ -325,36 +660,40 @@ class BuildLogAnalyzer:
         for i, data in enumerate(fig.data):
             data.visible = i == 0
 
-        # Write the HTML with custom post-script to remove user-select-none class
-        remove_user_select_script = """
-            document.addEventListener('DOMContentLoaded', function() {
-            var elements = document.getElementsByClassName('user-select-none');
-            while(elements.length > 0) {
-                elements[0].classList.remove('user-select-none');
-            }
-            });
-        """
+        # Removes the user-select-none class and loads all failures of a cluster on demand
+        post_script = cluster_logs_post_script(
+            os.path.basename(self.logs_data_dir), counts
+        )
 
         fig.write_html(
             self.final_logs_html_path,
             full_html=True,
             include_plotlyjs="cdn",
-            post_script=remove_user_select_script,
+            post_script=post_script,
         )
         click.echo(
             f"Cluster logs saved to {click.format_filename(self.final_logs_html_path)}"
         )
+        self.report.record(
+            rows=len(df),
+            bytes=os.path.getsize(self.final_logs_html_path)
+            + directory_size(self.logs_data_dir),
+        )
 
     def analyze_and_visualize_clusters(self):
-        self._embed_summaries_cluster()
+        self._embed_summaries_cluster(
+            mmap_mode="r" if self.clustering_mode == "large" else None
+        )
         self._create_scatter_plot()
         self._create_cluster_logs()
 
+    @instrumented("process_failure_logs")
     def process_failure_logs(self):
         # Load data
-        df = pd.read_excel(self.build_manifest_path)
+        df, cached = read_manifest(self.source, self.manifest_cache_path)
+        self.report.record(cache_hits=int(cached), cache_misses=int(not cached))
         # Only keep the logs of the failures
-        df = df[df["Outcome"] == "Failure"]
+        df = df[df["Outcome"] == "Failure"].copy()
         # Add column "Solved" if not present, default to False
         if "Solved" not in df.columns:
             df["Solved"] = False
@@ -364,10 +703,17 @@ class BuildLogAnalyzer:
         # Save logs
         df.to_csv(self.failures_path)
         click.echo("Created " + self.failures_path + " with " + str(len(df)) + " rows")
+        self.report.record(rows=len(df))
 
+    @instrumented("load_failure_logs")
     def load_failure_logs(self):
         # check if repos/failure.csv exists
-        click.echo("Loading logs from " + click.format_filename(self.failures_path))
+        click.echo(
+            "Loading logs from "
+            + click.format_filename(self.failures_path)
+            + " and "
+            + click.format_filename(str(self.source))
+        )
         if not os.path.exists(self.failures_path):
             # exit
             click.echo("File not found: " + self.failures_path, err=True)
@@ -376,15 +722,41 @@ class BuildLogAnalyzer:
         number_of_logs = len(df)
         if "logs" not in df.columns:
             df["logs"] = None
-        for idx, row in df.iterrows():
-            log_path = row["Build log"]
-            if not os.path.exists(os.path.join(self.output_dir, log_path)):
-                # if you cannot find the log, we can assume the user considers that type of failure as solved
-                df.at[idx, "Solved"] = True
-            elif row["logs"] is None:
-                df.at[idx, "logs"] = open(
-                    os.path.join(self.output_dir, log_path), encoding="UTF-8"
-                ).read()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.io_workers) as executor:
+            results = list(
+                executor.map(
+                    self.source.read_log,
+                    df["Build log"],
+                    df["logs"].isna(),
+                    [None] * len(df)
+                    if self.read_full_logs
+                    else df.apply(get_build_type, axis=1),
+                )
+            )
+        elapsed = time.perf_counter() - start
+
+        exists = [found for found, _, _ in results]
+        # if you cannot find the log, we can assume the user considers that type of failure as solved
+        df.loc[[not found for found in exists], "Solved"] = True
+        loaded = [text is not None for _, text, _ in results]
+        df.loc[loaded, "logs"] = [text for _, text, _ in results if text is not None]
+        # Bytes read of each log, or the size of the logs failures.csv already held
+        df["log_bytes"] = [
+            size or (len(log.encode("UTF-8")) if isinstance(log, str) else 0)
+            for (_, _, size), log in zip(results, df["logs"])
+        ]
+
+        files_read = sum(loaded)
+        bytes_read = sum(size for _, _, size in results)
+        self.report.record(rows=files_read, bytes=bytes_read)
+        megabytes_read = bytes_read / 1024**2
+        if elapsed > 0:
+            click.echo(
+                f"Read {files_read} logs ({megabytes_read:.1f} MB) in {elapsed:.2f}s: "
+                f"{files_read / elapsed:.1f} files/s, {megabytes_read / elapsed:.1f} MB/s"
+            )
         # only keep the logs of the failures that haven't been solved yet
         df = df[df["Solved"] == False]
         self.data_frames = df
@@ -397,144 +769,25 @@ class BuildLogAnalyzer:
                 + " logs that were already solved, therefore they are not loaded."
             )
 
-    def _extract_stacktrace_bazel(self, row):
-        log = row["logs"]
-        parts = log.split("BUILD FAILED with an exception:")
-        message = parts[-1].strip().split("\n")[0]
-
-        error_line = parts[-2].strip().split("\n")[-1]
-        if error_line.startswith("ERROR"):
-            message += "\n" + error_line
-
-        return message
-
-    def _extract_stacktrace_dotnet(self, row):
-        log = row["logs"]
-        get_caused_by = log.split("Caused by: ")[-1]
-        if get_caused_by:
-            return get_caused_by.split("\n")[0]
-        return ""
-
-    def _extract_stacktrace_maven(self, row):
-        log = row["logs"]
-        patterns = [
-            re.compile(
-                r"(\[INFO\] BUILD FAILURE.*?Re-run Maven using the -X switch to enable full debug logging\.)",
-                re.DOTALL,
-            ),
-            re.compile(r"(BUILD FAILED with an exception:.*)", re.DOTALL),
-        ]
-        matches = []
-        # Find matches using the patterns
-        for pattern in patterns:
-            matches = pattern.findall(log)
-            if len(matches) > 0:
-                break
-        if len(matches) > 0:
-            extracted_log = self._remove_lines_stacktrace_maven(matches[-1])
-            return extracted_log
-        return None
-
-    def _remove_lines_stacktrace_maven(self, log):
-        lines_to_keep = []
-        start_removing = True
-        for line in log.split("\n"):
-            if (
-                "[INFO] BUILD FAILURE" in line
-                or "Caused by:" in line
-                or "BUILD FAILED with an exception" in line
-            ):
-                start_removing = False
-            elif (
-                "at org.apache.maven.plugin.DefaultMojosExecutionStrategy" in line
-                or "at org.apache.maven.lifecycle.internal.LifecycleDependencyResolver"
-                in line
-                or "at org.apache.maven.lifecycle.internal.MojoExecutor.doExecute"
-                in line
-            ):
-                start_removing = True
-            if not start_removing:
-                lines_to_keep.append(line)
-        return "\n".join(lines_to_keep)
-
-    def _extract_stacktrace_gradle(self, row):
-        log = row["logs"]
-        # Define the regex patterns
-        patterns = [
-            re.compile(
-                r"(\* Exception is:.*?\* Get more help at https://help\.gradle\.org)",
-                re.DOTALL,
-            ),
-            re.compile(r"(\* Exception is:.*?BUILD FAILED in)", re.DOTALL),
-            re.compile(r"(BUILD FAILED with an exception:.*)", re.DOTALL),
-        ]
-        matches = []
-        # Find matches using the patterns
-        for pattern in patterns:
-            matches = pattern.findall(log)
-            if len(matches) > 0:
-                break
-        if len(matches) > 0:
-            extracted_log = self._remove_lines_stacktrace_gradle(matches[-1])
-            return extracted_log  # return last match
-        else:
-            click.echo(f"Gradle log not found for {str(row['Path'])}")
-            return None
-
-    def _remove_lines_stacktrace_gradle(self, log):
-        lines_to_keep = []
-        start_removing = True
-        for line in log.split("\n"):
-            if (
-                "* Exception is" in line
-                or "Caused by: " in line
-                or "BUILD FAILED with an exception" in line
-            ):
-                start_removing = False
-            elif (
-                "at org.gradle.api.internal" in line
-                or "at org.gradle.process.internal.DefaultExecHandle" in line
-                or "at org.gradle.internal.DefaultBuildOperationRunner" in line
-            ):
-                start_removing = True
-            if not start_removing:
-                lines_to_keep.append(line)
-        if len(lines_to_keep) == 0:
-            click.echo("No lines left after removing stacktrace")
-            return ""
-        return "\n".join(lines_to_keep)
-
+    @instrumented("extract_failure_stacktraces")
     def extract_failure_stacktraces(self):
         # Load intermediate result
         df = self.data_frames
-        extract_stacktraces = []
-        for row in df.iloc:
-            if not pd.isna(row["Maven version"]):
-                extract_stacktraces.append(self._extract_stacktrace_maven(row))
-            elif not pd.isna(row["Gradle version"]):
-                extract_stacktraces.append(self._extract_stacktrace_gradle(row))
-            elif not pd.isna(row["Bazel version"]):
-                extract_stacktraces.append(self._extract_stacktrace_bazel(row))
-            elif not pd.isna(row["Dotnet version"]):
-                extract_stacktraces.append(self._extract_stacktrace_dotnet(row))
-            else:
-                # Try each build type and keep the first successful extraction
-                extractors = [
-                    self._extract_stacktrace_gradle,
-                    self._extract_stacktrace_maven,
-                    self._extract_stacktrace_bazel,
-                    self._extract_stacktrace_dotnet,
-                ]
-                for extractor in extractors:
-                    try:
-                        extracted = extractor(row)
-                        if extracted is not None:
-                            extract_stacktraces.append(extracted)
-                            break
-                    except IndexError:
-                        continue
-        # Save summaries
-        df["Extracted logs"] = extract_stacktraces
+        self.report.record(rows=len(df), bytes=int(df["log_bytes"].sum()))
+        results = extract_stacktraces(
+            df["logs"],
+            df.apply(get_build_type, axis=1),
+            df["Path"],
+            workers=self.extract_workers,
+        )
+        extracted_logs = []
+        for extracted, messages in results:
+            for message in messages:
+                click.echo(message)
+            extracted_logs.append(extracted)
+        # Save summaries, releasing the raw logs that are no longer needed
+        df["Extracted logs"] = extracted_logs
+        df = df.drop(columns=["logs", "log_bytes"])
         any_failures = False
         for row in df.iloc:
             extract_stacktrace = row["Extracted logs"]
@@ -548,3 +801,76 @@ class BuildLogAnalyzer:
                 f"Successfully extracted logs for {len(df)} in {self.output_dir}"
             )
         self.data_frames = df
+        save_checkpoint(
+            self.extracted_logs_path,
+            self._extraction_fingerprint(),
+            df,
+        )
+
+    def _extraction_fingerprint(self):
+        failures = file_fingerprint(self.failures_path)
+        if failures is None:
+            return None
+        # Deleting a log marks its failure as solved, and a rewritten log is
+        # extracted again
+        log_paths = pd.read_csv(self.failures_path, usecols=["Build log"])["Build log"]
+        return fingerprint(
+            failures,
+            self.source.manifest_fingerprint(),
+            [self.source.log_fingerprint(log_path) for log_path in log_paths],
+            self.read_full_logs,
+            # The extraction and which part of each log it reads
+            file_fingerprint(log_extractors.__file__),
+            file_fingerprint(log_sources.__file__),
+        )
+
+    def resume_extracted_logs(self):
+        """Reuse the extracted logs of a previous run with the same failures.csv,
+        builds.xlsx, build logs and extraction, instead of reading and extracting the
+        logs again."""
+        if not self.resume:
+            return False
+        df = load_checkpoint(self.extracted_logs_path, self._extraction_fingerprint())
+        if df is None:
+            return False
+        click.echo(
+            "Resuming from the extracted logs in "
+            + click.format_filename(self.extracted_logs_path)
+        )
+        self.data_frames = df
+        return True
+
+    @instrumented("normalize_failure_signatures")
+    def normalize_failure_signatures(self):
+        """Give every row the signature its extracted log is embedded and clustered by.
+
+        Rows whose extracted logs only differ in volatile tokens such as
+        timestamps, paths, line numbers, hashes or versions share a signature.
+        """
+        df = self.data_frames
+        # Clean and validate extracted logs
+        df["Extracted logs"] = df["Extracted logs"].apply(
+            lambda x: str(x).strip() if pd.notna(x) else ""
+        )
+        if self.normalize_signatures:
+            df["Signature"] = df["Extracted logs"].map(normalize_signature)
+        else:
+            df["Signature"] = df["Extracted logs"]
+        click.echo(
+            f"Found {df['Signature'].nunique()} distinct failure signatures "
+            f"in {len(df)} extracted logs"
+        )
+        self.report.record(rows=len(df))
+        self.data_frames = df
+
+    def echo_run_report(self):
+        slowest = self.report.slowest_stage()
+        click.echo(
+            f"Run report saved to {click.format_filename(self.report.path)}, "
+            f"slowest stage: {slowest} ({self.report.stages[slowest]['wall_seconds']:.1f}s)"
+        )
+        if self.report.profiled:
+            click.echo(
+                f"cProfile stats of {self.report.profiled['stage']} saved to "
+                f"{click.format_filename(self.report.profiled['path'])}"
+            )
@@ -0,0 +1,101 @@
+"""Stage outputs saved so an interrupted or repeated run resumes where its inputs changed.
+
+Each checkpoint is stored with the fingerprint of the inputs and parameters it
+was computed from, and is only used when the fingerprint of the current run
+matches. Pickled checkpoints hold their fingerprint; .npy checkpoints, which
+are memory-mapped, keep it in a sidecar file written after the array.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+
+FINGERPRINT_SUFFIX = ".fingerprint"
+# Rows of an array hashed at a time, so memory-mapped arrays are not read whole
+FINGERPRINT_CHUNK_ROWS = 8192
+
+
+def fingerprint(*parts):
+    """Hash arrays, bytes, lists and JSON-serializable values into one fingerprint."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            digest.update(f"{part.dtype}{part.shape}".encode("UTF-8"))
+            rows = np.atleast_1d(part)
+            for start in range(0, len(rows), FINGERPRINT_CHUNK_ROWS):
+                chunk = rows[start : start + FINGERPRINT_CHUNK_ROWS]
+                digest.update(np.ascontiguousarray(chunk))
+        elif isinstance(part, bytes):
+            digest.update(part)
+        elif isinstance(part, list):
+            # Serialized item by item, so a list such as every signature is never
+            # held a second time as one string
+            digest.update(b"[")
+            for item in part:
+                digest.update(json.dumps(item, sort_keys=True, default=str).encode("UTF-8"))
+                digest.update(b"\0")
+            digest.update(b"]")
+        else:
+            digest.update(json.dumps(part, sort_keys=True, default=str).encode("UTF-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def file_fingerprint(path, chunk_size=1024 * 1024):
+    """Hash the content of a file, None when it does not exist."""
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_checkpoint(path, key):
+    """Return the value saved at `path` if it was saved with fingerprint `key`.
+
+    A checkpoint that cannot be unpickled, such as one truncated by a crash of a
+    version that wrote it in place, counts as missing.
+    """
+    if key is None or not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            checkpoint = pickle.load(f)
+    except (EOFError, pickle.UnpicklingError):
+        return None
+    return checkpoint["value"] if checkpoint["fingerprint"] == key else None
+
+
+def save_checkpoint(path, key, value):
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(
+            {"fingerprint": key, "value": value}, f, protocol=pickle.HIGHEST_PROTOCOL
+        )
+    os.replace(path + ".tmp", path)
+
+
+def array_checkpoint_is_current(path, key):
+    """Whether the .npy file at `path` was completely written with fingerprint `key`."""
+    try:
+        with open(path + FINGERPRINT_SUFFIX) as f:
+            return os.path.exists(path) and f.read() == key
+    except FileNotFoundError:
+        return False
+
+
+def invalidate_array_checkpoint(path):
+    """Forget the fingerprint of an .npy file before it is rewritten."""
+    try:
+        os.remove(path + FINGERPRINT_SUFFIX)
+    except FileNotFoundError:
+        pass
+
+
+def mark_array_checkpoint(path, key):
+    with open(path + FINGERPRINT_SUFFIX, "w") as f:
+        f.write(key)
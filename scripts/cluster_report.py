@@ -0,0 +1,132 @@
+"""Helpers of the cluster logs report.
+
+The report only embeds the failures nearest to each cluster centroid, one per
+distinct signature. Every member of a cluster is written to a gzip-compressed
+sidecar page of `clusters_logs_data/`, which the report loads when asked to
+show all of them. As for the scatter plot, the pages are scripts rather than
+JSON read with fetch() so the report still works when opened from disk.
+"""
+
+import base64
+import gzip
+import json
+import os
+import shutil
+
+from page_scripts import page_script
+
+REPORT_COLUMNS = ["Failures", "Path", "Build", "Extracted logs"]
+
+
+def cluster_members(df):
+    """Return the rows ordered by cluster and distance to its centroid, counting the
+    failures that share each signature in the "Failures" column."""
+    ordered = df.sort_values(["kmeans_summary", "Centroid distance"], kind="stable")
+    failures = ordered.groupby(["kmeans_summary", "Signature"], sort=False)[
+        "Signature"
+    ].transform("size")
+    return ordered.assign(Failures=failures)
+
+
+def table_columns(members):
+    """Return the cells of a report table as a list of columns."""
+    return [
+        members["Failures"].tolist(),
+        members["Path"].tolist(),
+        members["Build"].tolist(),
+        [str(log).replace("\n", "<br>") for log in members["Extracted logs"]],
+    ]
+
+
+def write_member_pages(pages, data_dir):
+    """Write the table columns of every member of each cluster as compressed scripts."""
+    shutil.rmtree(data_dir, ignore_errors=True)
+    os.makedirs(data_dir)
+    for cluster_id, columns in pages.items():
+        compressed = gzip.compress(json.dumps(columns, separators=(",", ":")).encode("UTF-8"))
+        with open(os.path.join(data_dir, f"cluster-{cluster_id}.js"), "w") as f:
+            f.write(
+                f'window.clusterLogsPage({cluster_id}, "{base64.b64encode(compressed).decode("ascii")}");\n'
+            )
+
+
+def cluster_logs_post_script(data_dir_name, counts):
+    """Button of the report that replaces the visible representatives with all members."""
+    settings = (
+        f"var logsDataDir = {json.dumps(data_dir_name)};\n"
+        f"var clusterCounts = {json.dumps([int(count) for count in counts])};\n"
+    )
+    return settings + page_script(CLUSTER_LOGS_POST_SCRIPT)
+
+
+CLUSTER_LOGS_POST_SCRIPT = """
+    var plot = document.querySelector(".plotly-graph-div");
+    if (!plot) {
+        return;
+    }
+    var loaded = {};
+    var loading = {};
+
+    var button = document.createElement("button");
+    button.style.margin = "8px";
+    plot.parentNode.insertBefore(button, plot);
+
+    function visibleCluster() {
+        for (var i = 0; i < plot.data.length; i++) {
+            if (plot.data[i].visible === true) {
+                return i;
+            }
+        }
+        return 0;
+    }
+
+    function refreshButton() {
+        var cluster = visibleCluster();
+        button.disabled = loaded[cluster] || loading[cluster];
+        if (loaded[cluster]) {
+            button.textContent = "Showing all " + clusterCounts[cluster] + " failures";
+        } else if (loading[cluster]) {
+            button.textContent = "Loading...";
+        } else {
+            button.textContent = "Show all " + clusterCounts[cluster] + " failures of cluster " + cluster;
+        }
+    }
+
+    function decompress(data) {
+        var bytes = Uint8Array.from(atob(data), function(c) { return c.charCodeAt(0); });
+        var stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream("gzip"));
+        return new Response(stream).json();
+    }
+
+    window.clusterLogsPage = function(cluster, data) {
+        decompress(data).then(function(columns) {
+            Plotly.restyle(plot, {"cells.values": [columns]}, [cluster]);
+            loaded[cluster] = true;
+        }).catch(function() {
+            button.textContent = "Could not read the failures of cluster " + cluster;
+        }).finally(function() {
+            delete loading[cluster];
+            if (loaded[cluster]) {
+                refreshButton();
+            }
+        });
+    };
+
+    button.addEventListener('click', function() {
+        var cluster = visibleCluster();
+        loading[cluster] = true;
+        refreshButton();
+        var script = document.createElement("script");
+        script.src = logsDataDir + "/cluster-" + cluster + ".js";
+        script.onerror = function() {
+            delete loading[cluster];
+            button.disabled = false;
+            button.textContent = "Failures unavailable, keep " + logsDataDir + " next to this file";
+            script.remove();
+        };
+        document.head.appendChild(script);
+    });
+
+    plot.on('plotly_update', refreshButton);
+    refreshButton();
+"""
@@ -0,0 +1,217 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+from threadpoolctl import threadpool_limits
+
+# Passes over the embeddings when fitting MiniBatchKMeans out of core
+_PARTIAL_FIT_EPOCHS = 2
+
+# Sweeps fitting fewer embedding rows than this, summed over the candidate k
+# values, run in the calling process: spawning the workers and importing
+# scikit-learn in each costs more than fitting such small inputs
+SERIAL_SWEEP_MAX_WORK = 20_000
+
+# Embedding matrix shared by the k-selection workers, set once per process
+_embeddings = None
+# Embedding row of every original row, and how many rows share each embedding
+_row_groups = None
+_sample_weight = None
+
+
+def _share_embeddings(embeddings, row_groups=None):
+    global _embeddings, _row_groups, _sample_weight
+    if isinstance(embeddings, str):
+        # Each worker maps the .npy file itself instead of receiving a copy
+        embeddings = np.load(embeddings, mmap_mode="r")
+    _embeddings = embeddings
+    _row_groups = row_groups
+    _sample_weight = (
+        None
+        if row_groups is None
+        else np.bincount(row_groups, minlength=len(embeddings)).astype(np.float64)
+    )
+
+
+def _init_worker(embeddings, threads, row_groups=None):
+    _share_embeddings(embeddings, row_groups)
+    threadpool_limits(limits=threads)
+
+
+def predict_in_chunks(kmeans, embeddings, chunk_size):
+    labels = np.empty(len(embeddings), dtype=np.int32)
+    for start in range(0, len(embeddings), chunk_size):
+        labels[start : start + chunk_size] = kmeans.predict(
+            embeddings[start : start + chunk_size]
+        )
+    return labels
+
+
+def nearest_centroids(embeddings, centers, chunk_size=8192):
+    """Return the index of and euclidean distance to the nearest center of every row."""
+    labels = np.empty(len(embeddings), dtype=np.int32)
+    distances = np.empty(len(embeddings), dtype=np.float32)
+    centers = np.asarray(centers, dtype=np.float64)
+    center_norms = (centers**2).sum(axis=1)
+    for start in range(0, len(embeddings), chunk_size):
+        chunk = np.asarray(embeddings[start : start + chunk_size], dtype=np.float64)
+        # ||a - b||^2 = ||a||^2 - 2 a.b + ||b||^2, without a chunk x k x dim difference
+        squared = (chunk**2).sum(axis=1)[:, np.newaxis] - 2 * chunk @ centers.T + center_norms
+        nearest = squared.argmin(axis=1)
+        labels[start : start + len(chunk)] = nearest
+        distances[start : start + len(chunk)] = np.sqrt(
+            np.maximum(squared[np.arange(len(chunk)), nearest], 0)
+        )
+    return labels, distances
+
+
+def stratified_sample(labels, sample_size, random_state):
+    """Return sorted row indices sampling each cluster proportionally to its size.
+
+    Returns None when there are no more rows than `sample_size`, meaning the
+    whole population should be used.
+    """
+    if sample_size is None or len(labels) <= sample_size:
+        return None
+
+    rng = np.random.default_rng(random_state)
+    clusters, counts = np.unique(labels, return_counts=True)
+    indices = []
+    for cluster, count in zip(clusters, counts):
+        # Keep at least two members per cluster so silhouette stays defined
+        quota = min(count, max(2, count * sample_size // len(labels)))
+        members = np.flatnonzero(labels == cluster)
+        indices.append(rng.choice(members, size=quota, replace=False))
+    return np.sort(np.concatenate(indices))
+
+
+def _fit_kmeans(k, random_state, chunk_size):
+    if chunk_size is None:
+        kmeans = KMeans(n_clusters=k, n_init=10, random_state=random_state).fit(
+            _embeddings, sample_weight=_sample_weight
+        )
+        return kmeans.labels_, kmeans.cluster_centers_
+
+    kmeans = MiniBatchKMeans(n_clusters=k, random_state=random_state)
+    for _ in range(_PARTIAL_FIT_EPOCHS):
+        for start in range(0, len(_embeddings), chunk_size):
+            kmeans.partial_fit(
+                _embeddings[start : start + chunk_size],
+                sample_weight=None
+                if _sample_weight is None
+                else _sample_weight[start : start + chunk_size],
+            )
+    return predict_in_chunks(kmeans, _embeddings, chunk_size), kmeans.cluster_centers_
+
+
+def _evaluate_k(k, random_state, sample_size, chunk_size):
+    labels, centers = _fit_kmeans(k, random_state, chunk_size)
+    if _row_groups is None:
+        sample = stratified_sample(labels, sample_size, random_state)
+        if sample is None:
+            score = silhouette_score(_embeddings, labels, metric="euclidean")
+        else:
+            score = silhouette_score(
+                _embeddings[sample], labels[sample], metric="euclidean"
+            )
+        return k, score, labels, centers
+
+    # Score the original rows, so shared embeddings count once per row
+    sample = stratified_sample(labels[_row_groups], sample_size, random_state)
+    rows = _row_groups if sample is None else _row_groups[sample]
+    score = silhouette_score(_embeddings[rows], labels[rows], metric="euclidean")
+    return k, score, labels, centers
+
+
+def select_k(
+    embeddings,
+    k_min=3,
+    k_max=20,
+    workers=None,
+    sample_size=10_000,
+    patience=None,
+    random_state=42,
+    chunk_size=None,
+    row_groups=None,
+):
+    """Fit KMeans for every k in [k_min, k_max] and keep the best silhouette score.
+
+    Candidates are fitted concurrently across `workers` processes but scored in
+    ascending k order, so ties resolve to the smallest k exactly as a serial sweep
+    would. With `patience`, the sweep stops once that many consecutive k values
+    fail to improve on the best score.
+
+    With `chunk_size`, each candidate is fitted incrementally with
+    MiniBatchKMeans over chunks of that many rows, and `embeddings` may be the
+    path of a .npy file that every worker memory-maps.
+
+    With `row_groups`, the embedding row of every original row, each embedding
+    is weighted by the number of rows sharing it and the silhouette score is
+    taken over the original rows.
+
+    Sweeps where the embedding rows times the candidate count stay below
+    `SERIAL_SWEEP_MAX_WORK` run serially whatever `workers` is.
+
+    Returns the best labels, their cluster centers and the score of every k
+    evaluated.
+    """
+    candidates = list(range(k_min, k_max + 1))
+    workers = min(workers or os.cpu_count() or 1, len(candidates))
+    rows = len(
+        np.load(embeddings, mmap_mode="r") if isinstance(embeddings, str) else embeddings
+    )
+    if rows * len(candidates) < SERIAL_SWEEP_MAX_WORK:
+        workers = 1
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    best_score = -100
+    best_k = None
+    best_labels = None
+    best_centers = None
+    scores = {}
+
+    def consider(result):
+        nonlocal best_score, best_k, best_labels, best_centers
+        k, score, labels, centers = result
+        scores[k] = score
+        if score > best_score:
+            best_score = score
+            best_k = k
+            best_labels = labels
+            best_centers = centers
+        # Number of consecutive k values evaluated since the last improvement
+        return k - best_k
+
+    if workers == 1:
+        # The sweep runs in this process, so limit its threads and release the
+        # embeddings only for its duration
+        with threadpool_limits(limits=threads):
+            _share_embeddings(embeddings, row_groups)
+            try:
+                for k in candidates:
+                    result = _evaluate_k(k, random_state, sample_size, chunk_size)
+                    if consider(result) == patience:
+                        break
+            finally:
+                _share_embeddings(None)
+        return best_labels, best_centers, scores
+
+    # Spawn rather than fork: the parent has already started torch/OpenMP threads
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(embeddings, threads, row_groups),
+    ) as executor:
+        futures = [
+            executor.submit(_evaluate_k, k, random_state, sample_size, chunk_size)
+            for k in candidates
+        ]
+        for future in futures:
+            if consider(future.result()) == patience:
+                executor.shutdown(cancel_futures=True)
+                break
+    return best_labels, best_centers, scores
@@ -0,0 +1,339 @@
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.shared_memory import SharedMemory
+
+import click
+import numpy as np
+from tqdm import tqdm
+
+MODEL_ID = "BAAI/bge-small-en-v1.5"
+EMBEDDING_DIM = 384  # BGE-small model has 384 dimensions
+EMBEDDING_BACKENDS = ["torch", "onnx", "onnx-int8"]
+# Inputs of the exported graph, in the order BertModel.forward takes them
+ONNX_INPUT_NAMES = ["input_ids", "attention_mask", "token_type_ids"]
+
+# Embedder of an embedding worker process, created once per process
+_worker_embedder = None
+
+
+def embedding_model(model_id, backend):
+    """Identify the embeddings a backend computes; int8 vectors differ slightly from
+    the full precision ones the torch and onnx backends compute."""
+    return model_id + ("+int8" if backend == "onnx-int8" else "")
+
+
+def clean_input(input_string):
+    if input_string is None or not isinstance(input_string, str):
+        return ""
+    return input_string.strip()
+
+
+class Embedder:
+    """BGE sentence embeddings. torch and transformers are imported when it is created."""
+
+    def __init__(self, model_id=MODEL_ID, batch_size=32, threads=None):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.model_id = model_id
+        self.batch_size = batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(model_id)
+        self.model = AutoModel.from_pretrained(model_id)
+        self.model.eval()
+
+    def embed_one(self, input_string):
+        import torch
+
+        cleaned_input = clean_input(input_string)
+        if not cleaned_input:
+            # Return zeros for empty or invalid input
+            return [0.0] * EMBEDDING_DIM
+
+        with torch.no_grad():
+            encoded_input = self.tokenizer(
+                [cleaned_input], padding=True, truncation=True, return_tensors="pt"
+            )
+            model_output = self.model(**encoded_input)
+            embedding = model_output[0][:, 0]
+            embedding = torch.nn.functional.normalize(embedding, p=2, dim=1)[0]
+            return embedding.tolist()
+
+    def embed(self, input_strings, batch_size=None, progress=True):
+        """Embed many strings at once, returning a float32 matrix in input order.
+
+        Inputs are tokenized once and sorted by token length so that each batch
+        holds strings of similar length and padding stays small. Empty or invalid
+        inputs keep a zero vector in their slot.
+        """
+        batch_size = batch_size or self.batch_size
+        embeddings = np.zeros((len(input_strings), EMBEDDING_DIM), dtype=np.float32)
+
+        cleaned_inputs = [clean_input(s) for s in input_strings]
+        rows = [i for i, cleaned in enumerate(cleaned_inputs) if cleaned]
+        if not rows:
+            return embeddings
+
+        encoded = self.tokenizer(
+            [cleaned_inputs[i] for i in rows], truncation=True, padding=False
+        )
+        features = [
+            {key: encoded[key][j] for key in encoded.keys()} for j in range(len(rows))
+        ]
+        order = sorted(range(len(rows)), key=lambda j: len(features[j]["input_ids"]))
+
+        with tqdm(
+            total=len(rows),
+            dynamic_ncols=True,
+            leave=False,
+            file=sys.stdout,
+            disable=not progress,
+        ) as progress_bar:
+            for start in range(0, len(order), batch_size):
+                bucket = order[start : start + batch_size]
+                embeddings[[rows[j] for j in bucket]] = self._forward(
+                    [features[j] for j in bucket]
+                )
+                progress_bar.update(len(bucket))
+
+        return embeddings
+
+    def _forward(self, features):
+        """Return the normalized CLS embeddings of one batch of tokenized inputs."""
+        import torch
+
+        with torch.no_grad():
+            encoded_input = self.tokenizer.pad(features, padding=True, return_tensors="pt")
+            model_output = self.model(**encoded_input)
+            embedding = model_output[0][:, 0]
+            return torch.nn.functional.normalize(embedding, p=2, dim=1).numpy()
+
+    def close(self):
+        pass
+
+
+class OnnxEmbedder(Embedder):
+    """Embedder running the model exported to ONNX through ONNX Runtime on the CPU.
+
+    The locally cached model is exported to `onnx_dir` on first use, and with
+    `quantize` its weights are additionally quantized to int8. Inference uses
+    `threads` intra-op threads, all CPUs by default.
+    """
+
+    def __init__(
+        self, model_id=MODEL_ID, batch_size=32, threads=None, onnx_dir="onnx", quantize=False
+    ):
+        onnxruntime = import_onnxruntime()
+        from transformers import AutoTokenizer
+
+        self.model_id = model_id
+        self.batch_size = batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(model_id)
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads or os.cpu_count() or 1
+        # One graph runs at a time, parallelism comes from the intra-op threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = (
+            onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        self.session = onnxruntime.InferenceSession(
+            export_onnx(model_id, onnx_dir, quantize),
+            options,
+            providers=["CPUExecutionProvider"],
+        )
+        self.input_names = [graph_input.name for graph_input in self.session.get_inputs()]
+
+    def embed_one(self, input_string):
+        if not clean_input(input_string):
+            return [0.0] * EMBEDDING_DIM
+        return self.embed([input_string], progress=False)[0].tolist()
+
+    def _forward(self, features):
+        encoded_input = self.tokenizer.pad(features, padding=True, return_tensors="np")
+        inputs = {
+            name: encoded_input[name].astype(np.int64) for name in self.input_names
+        }
+        embedding = self.session.run(["last_hidden_state"], inputs)[0][:, 0]
+        norms = np.linalg.norm(embedding, axis=1, keepdims=True)
+        return embedding / np.maximum(norms, 1e-12)
+
+
+def import_onnxruntime():
+    try:
+        import onnxruntime
+    except ImportError:
+        raise click.ClickException(
+            "The onnx embedding backends need the onnx extra: pip install '.[onnx]'"
+        )
+    return onnxruntime
+
+
+def export_onnx(model_id, onnx_dir, quantize=False):
+    """Export the locally cached model to ONNX once and return the path of the graph.
+
+    With `quantize`, the exported graph is also dynamically quantized to int8
+    weights. Both graphs are kept in `onnx_dir` for later runs.
+    """
+    model_dir = os.path.join(onnx_dir, model_id.replace("/", "--"))
+    fp32_path = os.path.join(model_dir, "model.onnx")
+    int8_path = os.path.join(model_dir, "model.int8.onnx")
+
+    if not os.path.exists(fp32_path):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        click.echo(f"Exporting {model_id} to {fp32_path}")
+        os.makedirs(model_dir, exist_ok=True)
+        tokenizer = AutoTokenizer.from_pretrained(model_id)
+        model = AutoModel.from_pretrained(model_id)
+        model.eval()
+        sample = tokenizer(["Exported build log embedding model"], return_tensors="pt")
+        dynamic_axes = {
+            name: {0: "batch", 1: "sequence"}
+            for name in ONNX_INPUT_NAMES + ["last_hidden_state"]
+        }
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                tuple(sample[name] for name in ONNX_INPUT_NAMES),
+                fp32_path + ".tmp",
+                input_names=ONNX_INPUT_NAMES,
+                output_names=["last_hidden_state", "pooler_output"],
+                dynamic_axes=dynamic_axes,
+                opset_version=17,
+            )
+        os.replace(fp32_path + ".tmp", fp32_path)
+
+    if not quantize:
+        return fp32_path
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        click.echo(f"Quantizing {fp32_path} to {int8_path}")
+        quantize_dynamic(fp32_path, int8_path + ".tmp", weight_type=QuantType.QInt8)
+        os.replace(int8_path + ".tmp", int8_path)
+    return int8_path
+
+
+class ParallelEmbedder:
+    """Embeds shards of the inputs across worker processes that each load the model once.
+
+    Every worker gets an explicit budget of `threads` intra-op threads, an equal
+    share of the CPUs by default, and tokenizer parallelism is disabled, so the
+    workers do not oversubscribe the cores. Workers write their rows straight
+    into a shared memory matrix at the rows' input positions.
+    """
+
+    def __init__(
+        self,
+        workers,
+        backend="torch",
+        model_id=MODEL_ID,
+        batch_size=32,
+        threads=None,
+        onnx_dir="onnx",
+    ):
+        self.model_id = model_id
+        self.batch_size = batch_size
+        self.workers = workers
+        self.threads = threads or max(1, (os.cpu_count() or 1) // workers)
+        if backend != "torch":
+            # Export before the workers start so they do not write the same graph concurrently
+            import_onnxruntime()
+            export_onnx(model_id, onnx_dir, quantize=backend == "onnx-int8")
+        # Spawn rather than fork so every worker starts its own thread pools
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_embedding_worker,
+            initargs=(
+                backend,
+                {
+                    "model_id": model_id,
+                    "batch_size": batch_size,
+                    "threads": self.threads,
+                    "onnx_dir": onnx_dir,
+                },
+            ),
+        )
+
+    def embed_one(self, input_string):
+        return self.embed([input_string], progress=False)[0].tolist()
+
+    def embed(self, input_strings, batch_size=None, progress=True):
+        """Embed many strings across the workers, returning a float32 matrix in input order."""
+        rows = len(input_strings)
+        if rows == 0:
+            return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        # Several shards per worker keep them busy when shards differ in length
+        shard_size = -(-rows // (self.workers * 4))
+
+        buffer = SharedMemory(create=True, size=rows * EMBEDDING_DIM * 4)
+        try:
+            futures = [
+                self.executor.submit(
+                    _embed_shard,
+                    buffer.name,
+                    rows,
+                    start,
+                    list(input_strings[start : start + shard_size]),
+                    batch_size,
+                )
+                for start in range(0, rows, shard_size)
+            ]
+            with tqdm(
+                total=rows,
+                dynamic_ncols=True,
+                leave=False,
+                file=sys.stdout,
+                disable=not progress,
+            ) as progress_bar:
+                for future in as_completed(futures):
+                    progress_bar.update(future.result())
+            return np.ndarray(
+                (rows, EMBEDDING_DIM), dtype=np.float32, buffer=buffer.buf
+            ).copy()
+        finally:
+            buffer.close()
+            buffer.unlink()
+
+    def close(self):
+        """Stop the worker processes."""
+        self.executor.shutdown()
+
+
+def _init_embedding_worker(backend, options):
+    global _worker_embedder
+    # Set before torch, ONNX Runtime or the tokenizers start their thread pools
+    os.environ["OMP_NUM_THREADS"] = str(options["threads"])
+    os.environ["MKL_NUM_THREADS"] = str(options["threads"])
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    _worker_embedder = create_embedder(backend, **options)
+
+
+def _embed_shard(buffer_name, rows, start, input_strings, batch_size):
+    buffer = SharedMemory(name=buffer_name)
+    try:
+        embeddings = np.ndarray((rows, EMBEDDING_DIM), dtype=np.float32, buffer=buffer.buf)
+        embeddings[start : start + len(input_strings)] = _worker_embedder.embed(
+            input_strings, batch_size, progress=False
+        )
+        del embeddings
+    finally:
+        buffer.close()
+    return len(input_strings)
+
+
+def create_embedder(backend="torch", workers=1, **options):
+    """Create the embedder of one of EMBEDDING_BACKENDS, in `workers` processes if more than one."""
+    if workers > 1:
+        return ParallelEmbedder(workers, backend, **options)
+    if backend == "torch":
+        options.pop("onnx_dir", None)
+        return Embedder(**options)
+    return OnnxEmbedder(quantize=backend == "onnx-int8", **options)
@@ -0,0 +1,90 @@
+import hashlib
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+# SQLite limits the number of host parameters per statement
+_QUERY_CHUNK_SIZE = 500
+
+
+class EmbeddingCache:
+    """On-disk embedding store keyed by a hash of the model id and cleaned text.
+
+    Entries are evicted least-recently-used first once the cache holds more than
+    `max_entries` vectors.
+    """
+
+    def __init__(self, cache_dir, model_id, max_entries=200_000):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "embeddings.sqlite")
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+        )
+        self.connection.commit()
+
+    def key(self, cleaned_input):
+        digest = hashlib.sha256()
+        digest.update(self.model_id.encode("UTF-8"))
+        digest.update(b"\0")
+        digest.update(cleaned_input.encode("UTF-8"))
+        return digest.hexdigest()
+
+    def get_many(self, keys):
+        keys = list(keys)
+        found = {}
+        for start in range(0, len(keys), _QUERY_CHUNK_SIZE):
+            chunk = keys[start : start + _QUERY_CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.connection.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                chunk,
+            ).fetchall()
+            for key, vector in rows:
+                found[key] = np.frombuffer(vector, dtype=np.float32)
+
+        now = time.time()
+        self.connection.executemany(
+            "UPDATE embeddings SET last_used = ? WHERE key = ?",
+            [(now, key) for key in found],
+        )
+        self.connection.commit()
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, vectors):
+        now = time.time()
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+            [
+                (key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+                for key, vector in vectors.items()
+            ],
+        )
+        self._evict()
+        self.connection.commit()
+
+    def _evict(self):
+        (count,) = self.connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if count > self.max_entries:
+            self.connection.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,163 @@
+"""Per-stage timing, memory and throughput of a pipeline run.
+
+Every stage records its wall and CPU time, how far it raised the peak resident
+set size, and the rows, bytes and cache lookups it reports. Stages run more
+than once, such as embedding chunk by chunk, are summed under one name. The
+report is rewritten after every stage so that a failed run still leaves the
+measurements of the stages it completed.
+"""
+
+import cProfile
+import functools
+import json
+import os
+import pstats
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_bytes():
+    """Return the peak resident set size of this process, None where unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def cpu_seconds():
+    """CPU time of this process and its finished worker processes."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class RunReport:
+    """Measurements of the stages of a run, written as JSON to `path`.
+
+    With a `profile_path`, every outermost stage is run under cProfile. The stats
+    are summed per stage name like the measurements, and those of the slowest
+    profiled stage are kept at `profile_path`.
+    """
+
+    def __init__(self, path, profile_path=None):
+        self.path = path
+        self.profile_path = profile_path
+        self.started = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.profiled = None
+        self._profiles = {}
+        self._active = []
+
+    @contextmanager
+    def stage(self, name):
+        metrics = self.stages.setdefault(
+            name,
+            {
+                "calls": 0,
+                "wall_seconds": 0.0,
+                "cpu_seconds": 0.0,
+                "peak_rss_delta_bytes": None,
+            },
+        )
+        # cProfile cannot profile nested stages on top of each other
+        profiler = cProfile.Profile() if self.profile_path and not self._active else None
+        self._active.append(metrics)
+        peak_before = peak_rss_bytes()
+        cpu_before = cpu_seconds()
+        start = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            yield metrics
+        except BaseException:
+            metrics["failed"] = True
+            raise
+        finally:
+            if profiler:
+                profiler.disable()
+            elapsed = time.perf_counter() - start
+            self._active.pop()
+            metrics["calls"] += 1
+            metrics["wall_seconds"] += elapsed
+            metrics["cpu_seconds"] += cpu_seconds() - cpu_before
+            if peak_before is not None:
+                metrics["peak_rss_delta_bytes"] = (metrics["peak_rss_delta_bytes"] or 0) + (
+                    peak_rss_bytes() - peak_before
+                )
+            if profiler:
+                self._add_profile(name, profiler)
+            self.write()
+
+    def _add_profile(self, name, profiler):
+        if name in self._profiles:
+            self._profiles[name].add(profiler)
+        else:
+            self._profiles[name] = pstats.Stats(profiler)
+        # Nested-only stages are never profiled, so pick among the profiled ones
+        slowest = max(self._profiles, key=lambda stage: self.stages[stage]["wall_seconds"])
+        self._profiles[slowest].dump_stats(self.profile_path)
+        self.profiled = {
+            "stage": slowest,
+            "wall_seconds": self.stages[slowest]["wall_seconds"],
+            "path": self.profile_path,
+        }
+
+    def record(self, **counts):
+        """Add rows, bytes or cache hits and misses to the innermost running stage."""
+        if not self._active:
+            return
+        metrics = self._active[-1]
+        for key, count in counts.items():
+            metrics[key] = metrics.get(key, 0) + count
+
+    def slowest_stage(self):
+        if not self.stages:
+            return None
+        return max(self.stages, key=lambda name: self.stages[name]["wall_seconds"])
+
+    def to_dict(self):
+        stages = []
+        for name, metrics in self.stages.items():
+            stage = {"name": name, **metrics}
+            if metrics.get("rows") and metrics["wall_seconds"] > 0:
+                stage["rows_per_second"] = metrics["rows"] / metrics["wall_seconds"]
+            if metrics.get("bytes") and metrics["wall_seconds"] > 0:
+                stage["bytes_per_second"] = metrics["bytes"] / metrics["wall_seconds"]
+            lookups = metrics.get("cache_hits", 0) + metrics.get("cache_misses", 0)
+            if lookups:
+                stage["cache_hit_rate"] = metrics.get("cache_hits", 0) / lookups
+            stages.append(stage)
+        return {
+            "started": self.started,
+            "wall_seconds": time.perf_counter() - self.start,
+            "peak_rss_bytes": peak_rss_bytes(),
+            "slowest_stage": self.slowest_stage(),
+            "stages": stages,
+            "profile": self.profiled,
+        }
+
+    def write(self):
+        with open(self.path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+def instrumented(name):
+    """Run the decorated analyzer method as a stage of its run report."""
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.report.stage(name):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -1,40 +1,210 @@
+import fnmatch
+import hashlib
+import json
 import os
+import re
+import shutil
 import sys
+import threading
 import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
 from urllib.parse import urljoin
 
 import click
 import requests
-from utils import normalize_url, prepare_directory
+from artifact_cache import ArtifactCache
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+from utils import normalize_url
+
+# Size of the byte ranges a large artifact is split into. Progress is saved per
+# range, so at most this much is fetched again when a download resumes.
+RANGE_PART_SIZE = 32 * 1024 * 1024
+# Attempts per byte range before the download is abandoned
+RANGE_RETRIES = 3
+# Ingest zips are stamped with the minute of their run, e.g. ingest-log-202412190022-9.zip
+ARTIFACT_TIMESTAMP = re.compile(r"(?<!\d)(\d{12})(?!\d)")
 
 
 class LogDownloader:
-    def __init__(self, url, repository_path, log_file, username, password, output_dir):
+    def __init__(
+        self,
+        url,
+        repository_path,
+        log_file,
+        username,
+        password,
+        output_dir,
+        extract=True,
+        download_workers=4,
+        buffer_size=1024 * 1024,
+        artifact_cache_dir=None,
+        artifact_cache_max_bytes=20 * 1024**3,
+        artifact_glob=None,
+        since=None,
+        until=None,
+        latest=None,
+        concurrency=4,
+    ):
         self.url = url
         self.repository_path = repository_path
         self.log_file = log_file
         self.auth = (username, password) if username is not None else None
         self.output_dir = output_dir
+        self.extract = extract
+        self.download_workers = download_workers
+        self.buffer_size = buffer_size
+        self.artifact_cache = (
+            ArtifactCache(artifact_cache_dir, artifact_cache_max_bytes)
+            if artifact_cache_dir
+            else None
+        )
+        self.artifact_glob = artifact_glob
+        self.since = since
+        self.until = until
+        self.latest = latest
+        self.concurrency = concurrency
+
+        # One pooled session for browsing and downloading, so connections are reused
+        self.session = requests.Session()
+        self.session.auth = self.auth
+        adapter = HTTPAdapter(pool_maxsize=max(10, download_workers * concurrency))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @property
+    def bulk(self):
+        """Whether artifacts are selected by pattern or date instead of interactively."""
+        return any(
+            option is not None
+            for option in (self.artifact_glob, self.since, self.until, self.latest)
+        )
 
     def download_logs(self):
         if self.log_file:
-            self._download_and_unzip_file(
-                normalize_url(f"{self.url}/{self.log_file}"), "ingest.zip"
-            )
+            self._download_and_unzip_file(self.log_file, "ingest.zip")
+        elif self.bulk:
+            self._download_logs_bulk()
         else:
             self._download_logs_interactive()
 
-    def _download_and_unzip_file(self, url, file_name):
-        local_filename = self._download_file(url, file_name)
-        if not local_filename:
+    def _download_logs_bulk(self):
+        """Download every selected zip below the repository path into its own subdirectory."""
+        artifacts = self._select_artifacts(self._list_artifacts())
+        if not artifacts:
+            print("No files found to download.")
+            return
+        click.echo(
+            f"Downloading {len(artifacts)} artifact{'s' if len(artifacts) != 1 else ''}"
+        )
+
+        def download(path):
+            name = path.rsplit("/", 1)[-1]
+            self._download_and_unzip_file(
+                f"{self.repository_path}/{path}",
+                name,
+                os.path.join(self.output_dir, name.removesuffix(".zip")),
+            )
+
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = {executor.submit(download, path): path for path in artifacts}
+            for future, path in futures.items():
+                try:
+                    future.result()
+                except SystemExit:
+                    # The failure has been reported, keep downloading the others
+                    failed.append(path)
+        if failed:
+            print(f"Failed to download {len(failed)} of {len(artifacts)} artifacts")
+            sys.exit(1)
+
+    def _list_artifacts(self):
+        """Return the path of every zip below the repository path.
+
+        Folders are listed concurrently, each listing submitting its subfolders.
+        """
+        url = normalize_url(f"{self.url}/api/storage/{self.repository_path}")
+        artifacts = []
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pending = {executor.submit(self._collect_items, url, "")}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for item in future.result():
+                        if item["name"].endswith("/"):
+                            pending.add(
+                                executor.submit(self._collect_items, url, item["path"])
+                            )
+                        else:
+                            artifacts.append(item["path"].lstrip("/"))
+        return sorted(artifacts)
+
+    def _select_artifacts(self, paths):
+        """Filter artifact paths by glob and by the run timestamp in their name.
+
+        With a date bound or `latest`, only artifacts whose name holds a run
+        timestamp are kept, oldest first.
+        """
+        if self.artifact_glob is not None:
+            paths = [path for path in paths if fnmatch.fnmatch(path, self.artifact_glob)]
+        if self.since is None and self.until is None and self.latest is None:
+            return paths
+
+        stamped = []
+        for path in paths:
+            match = ARTIFACT_TIMESTAMP.search(path.rsplit("/", 1)[-1])
+            if match is None:
+                continue
+            timestamp = datetime.strptime(match.group(1), "%Y%m%d%H%M")
+            if self.since is not None and timestamp < self.since:
+                continue
+            if self.until is not None and timestamp >= self.until:
+                continue
+            stamped.append((timestamp, path))
+        stamped.sort()
+        if self.latest is not None:
+            stamped = stamped[-self.latest :]
+        return [path for _, path in stamped]
+
+    def _download_and_unzip_file(self, artifact_path, file_name, output_dir=None):
+        output_dir = output_dir or self.output_dir
+        if not self.extract:
+            # Keep the zip, the analyzer reads builds.xlsx and logs from it in place
+            os.makedirs(output_dir, exist_ok=True)
+            output_filename = os.path.join(output_dir, file_name)
+            local_filename, cached = self._fetch_artifact(artifact_path, output_filename)
+            if cached:
+                _link_or_copy(local_filename, output_filename)
+            click.echo(
+                f"Downloaded {output_filename}, analyze it with --from {output_filename}"
+            )
             return
 
-        # Prepare extraction directory
-        extract_to = self.output_dir
-        prepare_directory(extract_to)
+        # Download into the extraction directory rather than the working directory,
+        # so concurrent runs never share a path and a failed download resumes there
+        extract_to = output_dir
+        os.makedirs(extract_to, exist_ok=True)
+        local_filename, cached = self._fetch_artifact(
+            artifact_path, os.path.join(extract_to, file_name)
+        )
+
+        # Clear a previous extraction, keeping the downloaded zip
+        for entry in os.scandir(extract_to):
+            if entry.path == local_filename:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                os.remove(entry.path)
 
         self._unzip_file(local_filename, extract_to)
 
+        # Remove downloaded zip file unless the cache keeps it
+        if not cached:
+            os.remove(local_filename)
+
         # Count files in repos
         file_count = len(
             [
@@ -47,8 +217,36 @@ class LogDownloader:
             f"Extracted {file_count} file{'s' if file_count != 1 else ''} to {extract_to}"
         )
 
-        # Remove downloaded zip file
-        os.remove(local_filename)
+    def _fetch_artifact(self, artifact_path, local_filename):
+        """Download an artifact to `local_filename`, or find it in the artifact cache.
+
+        Returns the path holding the artifact and whether that path belongs to the
+        cache. Artifacts are cached under the sha256 checksum reported by the
+        storage API, so an unchanged artifact is never downloaded twice.
+        """
+        url = normalize_url(f"{self.url}/{artifact_path}")
+        sha256 = self._fetch_checksum(artifact_path)
+        if self.artifact_cache is None or sha256 is None:
+            return self._download_file(url, local_filename, sha256), False
+
+        cached_filename = self.artifact_cache.get(sha256)
+        if cached_filename:
+            click.echo(f"Using cached {artifact_path} (sha256 {sha256[:12]})")
+            return cached_filename, True
+        partial_filename = self.artifact_cache.partial_path(sha256)
+        self._download_file(url, partial_filename, sha256)
+        return self.artifact_cache.put(sha256, partial_filename), True
+
+    def _fetch_checksum(self, artifact_path):
+        """Return the sha256 checksum the storage API reports for an artifact, if any."""
+        try:
+            response = self.session.get(
+                normalize_url(f"{self.url}/api/storage/{artifact_path}"), timeout=30
+            )
+            response.raise_for_status()
+            return response.json().get("checksums", {}).get("sha256")
+        except (requests.RequestException, ValueError):
+            return None
 
     def _download_logs_interactive(self, path=""):
         fetching_from_url = normalize_url(
@@ -69,9 +267,7 @@ class LogDownloader:
             selected_item = sorted_items[0]
             if selected_item["name"].endswith(".zip"):
                 self._download_and_unzip_file(
-                    normalize_url(
-                        f"{self.url}/{self.repository_path}/{selected_item['path']}"
-                    ),
+                    f"{self.repository_path}/{selected_item['path']}",
                     selected_item["name"],
                 )
                 return
@@ -89,9 +285,7 @@ class LogDownloader:
                 selected_item = sorted_items[choice - 1]
                 if selected_item["name"].endswith(".zip"):
                     self._download_and_unzip_file(
-                        normalize_url(
-                            f"{self.url}/{self.repository_path}/{selected_item['path']}"
-                        ),
+                        f"{self.repository_path}/{selected_item['path']}",
                         selected_item["name"],
                     )
                 else:
@@ -124,24 +318,152 @@ class LogDownloader:
 
     def _fetch_directory_contents(self, url):
         try:
-            response = requests.get(url, auth=self.auth, timeout=30)
+            response = self.session.get(url, timeout=30)
             response.raise_for_status()
             return response.json()
         except requests.RequestException as e:
             print(f"Failed to fetch directory contents from {url}: {e}")
             sys.exit(1)
 
-    def _download_file(self, url, local_filename):
+    def _download_file(self, url, local_filename, sha256=None):
+        """Download a file, verifying it against `sha256` when it is given."""
         try:
-            with requests.get(url, auth=self.auth, stream=True, timeout=30) as r:
-                r.raise_for_status()
-                with open(local_filename, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        f.write(chunk)
-            return local_filename
+            headers = self._head(url)
+            size = int(headers.get("Content-Length", 0))
+            if headers.get("Accept-Ranges") == "bytes" and size > 0:
+                self._download_ranges(url, local_filename, size, headers.get("ETag"))
+                # Ranges arrive out of order, so the checksum is taken once they are all written
+                if sha256:
+                    with open(local_filename, "rb") as f:
+                        digest = hashlib.file_digest(f, "sha256").hexdigest()
+            else:
+                digest = self._download_stream(url, local_filename)
         except requests.RequestException as e:
             print(f"Failed to download file from {url}: {e}")
+            if os.path.exists(local_filename + ".download"):
+                print(f"Run the same command again to resume {local_filename}")
+            sys.exit(1)
+
+        if sha256 and digest != sha256:
+            os.remove(local_filename)
+            print(
+                f"Checksum mismatch for {url}: expected sha256 {sha256}, got {digest}"
+            )
             sys.exit(1)
+        return local_filename
+
+    def _head(self, url):
+        """Return the headers of a HEAD request, empty when the server rejects HEAD.
+
+        Without them the file is streamed in a single GET, which cannot resume.
+        """
+        try:
+            head = self.session.head(url, allow_redirects=True, timeout=30)
+            head.raise_for_status()
+            return head.headers
+        except requests.RequestException:
+            return {}
+
+    def _download_stream(self, url, local_filename):
+        """Stream a file to disk and return its sha256, hashed as it is written."""
+        digest = hashlib.sha256()
+        with self.session.get(url, stream=True, timeout=30) as r:
+            r.raise_for_status()
+            with open(local_filename, "wb") as f:
+                for chunk in r.iter_content(chunk_size=self.buffer_size):
+                    digest.update(chunk)
+                    f.write(chunk)
+        return digest.hexdigest()
+
+    def _download_ranges(self, url, local_filename, size, etag):
+        """Fetch the file as byte ranges across the download workers.
+
+        The file is preallocated and every range is written at its offset. The
+        bytes written to each range are recorded next to the file, so a failed
+        download resumes where each range stopped as long as the artifact is
+        unchanged.
+        """
+        state_path = local_filename + ".download"
+        state = {"url": url, "size": size, "etag": etag, "part_size": RANGE_PART_SIZE}
+        written = {}
+        if os.path.exists(local_filename) and os.path.exists(state_path):
+            with open(state_path) as f:
+                saved = json.load(f)
+            if {key: saved.get(key) for key in state} == state:
+                written = {int(offset): n for offset, n in saved["written"].items()}
+        if not written:
+            with open(local_filename, "wb") as f:
+                f.truncate(size)
+        for offset in range(0, size, RANGE_PART_SIZE):
+            written.setdefault(offset, 0)
+
+        def save_state():
+            with open(state_path + ".tmp", "w") as f:
+                json.dump({**state, "written": written}, f)
+            os.replace(state_path + ".tmp", state_path)
+
+        lock = threading.Lock()
+        with tqdm(
+            total=size,
+            initial=sum(written.values()),
+            unit="B",
+            unit_scale=True,
+            desc=url.rsplit("/", 1)[-1],
+        ) as progress:
+
+            def fetch(offset):
+                end = min(offset + RANGE_PART_SIZE, size)
+                for position in self._download_range(
+                    url, local_filename, offset + written[offset], end
+                ):
+                    progress.update(position - offset - written[offset])
+                    written[offset] = position - offset
+                with lock:
+                    save_state()
+
+            save_state()
+            try:
+                with ThreadPoolExecutor(max_workers=self.download_workers) as executor:
+                    # Raise the first failure once the other ranges have settled
+                    futures = [
+                        executor.submit(fetch, offset)
+                        for offset, n in written.items()
+                        if offset + n < min(offset + RANGE_PART_SIZE, size)
+                    ]
+                    for future in futures:
+                        future.result()
+            finally:
+                save_state()
+        os.remove(state_path)
+
+    def _download_range(self, url, local_filename, start, end):
+        """Write bytes [start, end) of the file, yielding the position after each write."""
+        position = start
+        for attempt in range(RANGE_RETRIES):
+            try:
+                headers = {"Range": f"bytes={position}-{end - 1}"}
+                with self.session.get(url, headers=headers, stream=True, timeout=30) as r:
+                    r.raise_for_status()
+                    if r.status_code != 206:
+                        raise requests.RequestException(
+                            f"Server ignored the range request for bytes {position}-{end - 1}"
+                        )
+                    with open(local_filename, "r+b") as f:
+                        f.seek(position)
+                        for chunk in r.iter_content(chunk_size=self.buffer_size):
+                            chunk = chunk[: end - position]
+                            f.write(chunk)
+                            position += len(chunk)
+                            yield position
+                if position >= end:
+                    return
+                raise requests.RequestException(
+                    f"Connection closed after {position - start} of {end - start} bytes"
+                )
+            except requests.RequestException:
+                # Retry from the last byte written, give up after the last attempt
+                if attempt == RANGE_RETRIES - 1:
+                    raise
 
     def _unzip_file(self, zip_path, extract_to):
         try:
@@ -149,3 +471,12 @@ class LogDownloader:
                 zip_ref.extractall(extract_to)
         except zipfile.BadZipFile as e:
             print(f"Bad zip file {zip_path}: {e}")
+
+
+def _link_or_copy(source, destination):
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
@@ -0,0 +1,235 @@
+"""Marker-driven extraction of failure sections from build logs.
+
+The extractors are plain functions of the log text so they can run in worker
+processes.
+
+The failure section of a log is located with plain substring searches that
+jump between the start and end markers the build tool prints, instead of
+`re.DOTALL` patterns with lazy `.*?`. Only the located block is split into
+lines for the keep/remove rules. The extracted text is identical to what the
+previous regex patterns followed by a line filter produced, but the cost stays
+linear in the log size even when start markers are never closed.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+MAVEN_FAILURE_START = "[INFO] BUILD FAILURE"
+MAVEN_FAILURE_END = "Re-run Maven using the -X switch to enable full debug logging."
+GRADLE_EXCEPTION_START = "* Exception is:"
+GRADLE_HELP_END = "* Get more help at https://help.gradle.org"
+GRADLE_FAILED_END = "BUILD FAILED in"
+BUILD_FAILED_WITH_EXCEPTION = "BUILD FAILED with an exception:"
+DOTNET_CAUSED_BY = "Caused by: "
+# Blocks whose start marker tail_is_sufficient needs to know is closed before a suffix
+TAIL_BLOCK_MARKERS = [
+    (MAVEN_FAILURE_START, MAVEN_FAILURE_END),
+    (GRADLE_EXCEPTION_START, GRADLE_HELP_END),
+]
+
+MAVEN_KEEP_MARKERS = (
+    "[INFO] BUILD FAILURE",
+    "Caused by:",
+    "BUILD FAILED with an exception",
+)
+MAVEN_REMOVE_MARKERS = (
+    "at org.apache.maven.plugin.DefaultMojosExecutionStrategy",
+    "at org.apache.maven.lifecycle.internal.LifecycleDependencyResolver",
+    "at org.apache.maven.lifecycle.internal.MojoExecutor.doExecute",
+)
+GRADLE_KEEP_MARKERS = (
+    "* Exception is",
+    "Caused by: ",
+    "BUILD FAILED with an exception",
+)
+GRADLE_REMOVE_MARKERS = (
+    "at org.gradle.api.internal",
+    "at org.gradle.process.internal.DefaultExecHandle",
+    "at org.gradle.internal.DefaultBuildOperationRunner",
+)
+
+
+def last_block(log, start, end):
+    """Return the (begin, stop) span of the last complete `start ... end` block.
+
+    This is the last match a lazy DOTALL `findall(start.*?end)` would return.
+    Any end marker closes an open block, so the scan never needs to look further
+    back than the end marker preceding the block. The search therefore walks
+    backwards from the end of the log.
+    """
+    end_at = log.rfind(end)
+    while end_at >= 0:
+        previous_end_at = log.rfind(end, 0, end_at)
+        search_from = 0 if previous_end_at < 0 else previous_end_at + len(end)
+        begin = log.find(start, search_from, end_at)
+        if begin >= 0:
+            return begin, end_at + len(end)
+        end_at = previous_end_at
+    return None
+
+
+def filter_lines(block, keep_markers, remove_markers):
+    """Keep lines from a keep marker onwards until a remove marker is seen."""
+    lines_to_keep = []
+    start_removing = True
+    for line in block.split("\n"):
+        if any(marker in line for marker in keep_markers):
+            start_removing = False
+        elif any(marker in line for marker in remove_markers):
+            start_removing = True
+        if not start_removing:
+            lines_to_keep.append(line)
+    return "\n".join(lines_to_keep)
+
+
+def _extract(log, block_markers, keep_markers, remove_markers):
+    # Block patterns are tried by priority, the first one with a match wins
+    for start, end in block_markers:
+        span = last_block(log, start, end)
+        if span is not None:
+            return filter_lines(log[span[0] : span[1]], keep_markers, remove_markers)
+    # Fall back to everything from the first "BUILD FAILED with an exception:"
+    begin = log.find(BUILD_FAILED_WITH_EXCEPTION)
+    if begin >= 0:
+        return filter_lines(log[begin:], keep_markers, remove_markers)
+    return None
+
+
+def extract_maven(log):
+    """Return the filtered last Maven failure block, or None if there is none."""
+    return _extract(
+        log,
+        [(MAVEN_FAILURE_START, MAVEN_FAILURE_END)],
+        MAVEN_KEEP_MARKERS,
+        MAVEN_REMOVE_MARKERS,
+    )
+
+
+def extract_gradle(log):
+    """Return the filtered last Gradle exception block, or None if there is none."""
+    return _extract(
+        log,
+        [
+            (GRADLE_EXCEPTION_START, GRADLE_HELP_END),
+            (GRADLE_EXCEPTION_START, GRADLE_FAILED_END),
+        ],
+        GRADLE_KEEP_MARKERS,
+        GRADLE_REMOVE_MARKERS,
+    )
+
+
+def extract_bazel(log):
+    parts = log.split(BUILD_FAILED_WITH_EXCEPTION)
+    message = parts[-1].strip().split("\n")[0]
+
+    error_line = parts[-2].strip().split("\n")[-1]
+    if error_line.startswith("ERROR"):
+        message += "\n" + error_line
+
+    return message
+
+
+def extract_dotnet(log):
+    get_caused_by = log.split(DOTNET_CAUSED_BY)[-1]
+    if get_caused_by:
+        return get_caused_by.split("\n")[0]
+    return ""
+
+
+def extract_stacktrace(log, build_type, path):
+    """Extract the failure section of one log.
+
+    Returns the extracted text, or None, together with the messages to report
+    for this log, so that workers never write to the console themselves.
+    """
+    messages = []
+
+    def extract_gradle_reporting(log):
+        extracted_log = extract_gradle(log)
+        if extracted_log is None:
+            messages.append(f"Gradle log not found for {str(path)}")
+        elif len(extracted_log) == 0:
+            messages.append("No lines left after removing stacktrace")
+        return extracted_log
+
+    if build_type == "maven":
+        return extract_maven(log), messages
+    elif build_type == "gradle":
+        return extract_gradle_reporting(log), messages
+    elif build_type == "bazel":
+        return extract_bazel(log), messages
+    elif build_type == "dotnet":
+        return extract_dotnet(log), messages
+
+    # Try each build type and keep the first successful extraction
+    extractors = [extract_gradle_reporting, extract_maven, extract_bazel, extract_dotnet]
+    for extractor in extractors:
+        try:
+            extracted = extractor(log)
+            if extracted is not None:
+                return extracted, messages
+        except IndexError:
+            continue
+    return None, messages
+
+
+def extract_stacktraces(logs, build_types, paths, workers=1):
+    """Run extract_stacktrace over many logs, in order, across `workers` processes."""
+    if workers == 1:
+        return list(map(extract_stacktrace, logs, build_types, paths))
+
+    logs = list(logs)
+    chunksize = max(1, min(256, len(logs) // (workers * 4)))
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        return list(
+            executor.map(
+                extract_stacktrace, logs, build_types, paths, chunksize=chunksize
+            )
+        )
+
+
+def _tail_holds_last_block(tail, unclosed_before, start, end):
+    """Whether the last `start ... end` block of the suffix is the last block of the log.
+
+    The block begins at the first start marker after the preceding end marker.
+    When that end marker is not in the suffix, the block still begins in the
+    suffix unless a start marker before it is left unclosed.
+    """
+    span = last_block(tail, start, end)
+    if span is None:
+        return False
+    return tail.rfind(end, 0, span[0]) >= 0 or not unclosed_before(start, end)
+
+
+def tail_is_sufficient(tail, build_type, unclosed_before):
+    """Whether this suffix of a log holds the markers its extractor needs.
+
+    The suffix must start at a line boundary. `unclosed_before(start, end)` tells
+    whether the log leaves a `start` marker unclosed before the suffix, so the
+    caller can check it on the raw bytes without decoding them. The last failure
+    block is taken from the suffix once it contains the block and no start marker
+    before the suffix is left open. The "BUILD FAILED with an exception:" fallback
+    always needs the whole log because it starts at the first occurrence.
+    """
+    if build_type == "maven":
+        return _tail_holds_last_block(
+            tail, unclosed_before, MAVEN_FAILURE_START, MAVEN_FAILURE_END
+        )
+    if build_type in ("gradle", "unknown/other"):
+        # Unknown build types try the Gradle extraction first
+        return _tail_holds_last_block(
+            tail, unclosed_before, GRADLE_EXCEPTION_START, GRADLE_HELP_END
+        )
+    if build_type == "bazel":
+        last = tail.rfind(BUILD_FAILED_WITH_EXCEPTION)
+        if last < 0:
+            return False
+        if tail.rfind(BUILD_FAILED_WITH_EXCEPTION, 0, last) >= 0:
+            return True
+        # The line before the marker must be complete
+        return "\n" in tail[:last].rstrip()
+    if build_type == "dotnet":
+        return DOTNET_CAUSED_BY in tail
+    return False
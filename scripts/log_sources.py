@@ -0,0 +1,289 @@
+import mmap
+import os
+import zipfile
+from collections import deque
+
+import click
+import pandas as pd
+from checkpoints import load_checkpoint, save_checkpoint
+from log_extractors import TAIL_BLOCK_MARKERS, tail_is_sufficient
+
+BUILD_MANIFEST = "builds.xlsx"
+# The only builds.xlsx columns the analysis uses
+MANIFEST_COLUMNS = [
+    "Path",
+    "Branch",
+    "Outcome",
+    "Build log",
+    "Maven version",
+    "Gradle version",
+    "Bazel version",
+    "Dotnet version",
+    "Solved",
+]
+# Bytes read from the end of a build log before growing the window
+TAIL_WINDOW_SIZE = 16 * 1024
+# Largest window tried before reading the whole log, and about the most of a
+# streamed log held in memory while looking for its tail
+TAIL_MAX_WINDOW = 4 * 1024 * 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+# Bytes kept before a rolling buffer so markers straddling its start are found
+_MARKER_OVERLAP = max(len(marker) for pair in TAIL_BLOCK_MARKERS for marker in pair) - 1
+
+
+def _decode_log(data):
+    # Same result as reading the file in text mode with universal newlines
+    return data.decode("UTF-8").replace("\r\n", "\n").replace("\r", "\n")
+
+
+def _unclosed_before(data, offset, start, end, carry=b"", open_before=False):
+    """Whether the raw log bytes before `offset` leave a `start` marker unclosed.
+
+    `data` may hold only the end of the log. `carry` then holds the bytes just
+    before it, so that markers straddling its start are seen, and `open_before`
+    whether a start marker is left unclosed before those.
+    """
+    begin = data.rfind(start, 0, offset)
+    if begin >= 0:
+        return data.find(end, begin, offset) < 0
+    if not carry and not open_before:
+        return False
+    if data.find(end, 0, offset) >= 0:
+        return False
+    boundary = carry + bytes(data[: min(offset, len(carry))])
+    begin, closed = boundary.rfind(start), boundary.rfind(end)
+    if begin >= 0 or closed >= 0:
+        return begin > closed
+    return open_before
+
+
+def _find_tail(data, size, build_type, window, max_window, carry=b"", open_starts=()):
+    """Return the tail of a log holding the markers its extractor needs and its
+    size, or None when no window of up to `max_window` bytes holds them.
+
+    `data` holds the last bytes of the log of `size` bytes, at least
+    `max_window` of them, see `_unclosed_before` for `carry`. `open_starts` are
+    the start markers left unclosed before `carry`. Windows from the end of the
+    log grow until the failure markers are found, and only the window is decoded.
+    """
+    base = size - len(data)
+    while window < size and window <= max_window:
+        # Start right after a line break so lines and characters stay whole
+        line_start = data.find(b"\n", size - window - base)
+        if line_start < 0:
+            break
+        offset = line_start + 1
+        tail = _decode_log(data[offset:])
+
+        def unclosed_before(start, end):
+            return _unclosed_before(
+                data, offset, start.encode(), end.encode(), carry, start in open_starts
+            )
+
+        if tail_is_sufficient(tail, build_type, unclosed_before):
+            return tail, len(data) - offset
+        window *= 4
+    return None
+
+
+def _read_tail(data, build_type, window=TAIL_WINDOW_SIZE, max_window=TAIL_MAX_WINDOW):
+    """Return the tail of a log holding the markers its extractor needs, and its size.
+
+    `data` holds the raw bytes of the log, such as a memory map. The whole log is
+    read when no window holds the markers.
+    """
+    found = _find_tail(data, len(data), build_type, window, max_window)
+    if found is None:
+        return _decode_log(data[:]), len(data)
+    return found
+
+
+def _stream_end(stream, keep):
+    """Read a stream to its end, holding only a rolling buffer of its last bytes.
+
+    Returns at least the last `keep` bytes, the `_MARKER_OVERLAP` bytes before
+    them and the start markers left unclosed before those.
+    """
+    chunks = deque()
+    held = 0
+    carry = b""
+    open_starts = set()
+    while chunk := stream.read(STREAM_CHUNK_SIZE):
+        chunks.append(chunk)
+        held += len(chunk)
+        while held - len(chunks[0]) >= keep:
+            dropped = chunks.popleft()
+            held -= len(dropped)
+            dropped = carry + dropped
+            for start, end in TAIL_BLOCK_MARKERS:
+                begin = dropped.rfind(start.encode())
+                closed = dropped.rfind(end.encode())
+                if begin > closed:
+                    open_starts.add(start)
+                elif closed > begin:
+                    open_starts.discard(start)
+            carry = dropped[-_MARKER_OVERLAP:]
+    return b"".join(chunks), carry, open_starts
+
+
+def _read_stream_tail(
+    open_stream, size, build_type, window=TAIL_WINDOW_SIZE, max_window=TAIL_MAX_WINDOW
+):
+    """Return the tail of a log read as a stream its extractor needs, and its size.
+
+    `open_stream()` opens the log from its start. Only about `max_window` bytes
+    of the log are held while it is streamed, the log is streamed again and read
+    whole when no window holds the markers.
+    """
+    with open_stream() as stream:
+        data, carry, open_starts = _stream_end(stream, max_window)
+    found = _find_tail(data, size, build_type, window, max_window, carry, open_starts)
+    if found is not None:
+        # The whole log was streamed to reach its tail
+        return found[0], size
+    if len(data) == size:
+        return _decode_log(data), size
+    with open_stream() as stream:
+        return _decode_log(stream.read()), size
+
+
+def read_log_tail(path, build_type):
+    """Memory-map a log file and return the tail its extractor needs, and its size."""
+    with open(path, "rb") as log_file:
+        size = os.fstat(log_file.fileno()).st_size
+        if size == 0:
+            return "", 0
+        with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return _read_tail(data, build_type)
+
+
+def read_log(path, read=True, build_type=None):
+    """Return whether the log exists, its text if `read` is set, and the number of bytes read.
+
+    With a `build_type`, only the tail of the log its extractor needs is read.
+    """
+    if not read:
+        return os.path.exists(path), None, 0
+    try:
+        if build_type is not None:
+            return True, *read_log_tail(path, build_type)
+        with open(path, encoding="UTF-8") as log_file:
+            return True, log_file.read(), os.fstat(log_file.fileno()).st_size
+    except FileNotFoundError:
+        return False, None, 0
+
+
+class DirectorySource:
+    """Mass ingest logs laid out in a directory, read in place."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def __str__(self):
+        return str(self.root)
+
+    def open_manifest(self):
+        return open(os.path.join(self.root, BUILD_MANIFEST), "rb")
+
+    def manifest_fingerprint(self):
+        """Identify the current version of builds.xlsx without reading it."""
+        stat = os.stat(os.path.join(self.root, BUILD_MANIFEST))
+        return f"{os.path.abspath(self.root)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    def log_fingerprint(self, log_path):
+        """Identify the current version of a log without reading it, None when it is missing."""
+        try:
+            stat = os.stat(os.path.join(self.root, log_path))
+        except FileNotFoundError:
+            return None
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    def read_log(self, log_path, read=True, build_type=None):
+        return read_log(os.path.join(self.root, log_path), read, build_type)
+
+
+class ZipSource:
+    """Mass ingest logs read member by member from the ingest zip, never extracted.
+
+    Reading members from several threads is safe, the archive serializes access
+    to the underlying file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.archive = zipfile.ZipFile(path)
+        self.members = {info.filename: info for info in self.archive.infolist()}
+        # The manifest and log paths are relative to the directory holding builds.xlsx
+        manifests = [
+            name
+            for name in self.members
+            if name == BUILD_MANIFEST or name.endswith("/" + BUILD_MANIFEST)
+        ]
+        manifest = min(manifests, key=lambda name: name.count("/"), default=BUILD_MANIFEST)
+        self.prefix = manifest[: -len(BUILD_MANIFEST)]
+
+    def __str__(self):
+        return str(self.path)
+
+    def _member(self, log_path):
+        name = self.prefix + os.path.normpath(log_path).replace(os.sep, "/")
+        return self.members.get(name)
+
+    def open_manifest(self):
+        return self.archive.open(self.prefix + BUILD_MANIFEST)
+
+    def manifest_fingerprint(self):
+        """Identify the current version of builds.xlsx by the CRC the zip stores for it."""
+        info = self.archive.getinfo(self.prefix + BUILD_MANIFEST)
+        return f"{os.path.abspath(self.path)}:{info.file_size}:{info.CRC:08x}"
+
+    def log_fingerprint(self, log_path):
+        """Identify the current version of a log by its CRC, None when it is missing."""
+        info = self._member(log_path)
+        if info is None:
+            return None
+        return f"{info.file_size}:{info.CRC:08x}"
+
+    def read_log(self, log_path, read=True, build_type=None):
+        info = self._member(log_path)
+        if info is None:
+            return False, None, 0
+        if not read:
+            return True, None, 0
+        if info.file_size == 0:
+            return True, "", 0
+        if build_type is None:
+            with self.archive.open(info) as member:
+                return True, _decode_log(member.read()), info.file_size
+        # Seeking in a deflated member decompresses it again from the start, so
+        # the member is streamed once, keeping only its end
+        return True, *_read_stream_tail(
+            lambda: self.archive.open(info), info.file_size, build_type
+        )
+
+
+def open_source(path):
+    """Return the source for a mass ingest logs directory or ingest zip file."""
+    if os.path.isfile(path) and zipfile.is_zipfile(path):
+        return ZipSource(path)
+    return DirectorySource(path)
+
+
+def read_manifest(source, cache_path):
+    """Return the used columns of builds.xlsx and whether they were read from the cache,
+    parsing the workbook only when it changed.
+
+    The columns are cached at `cache_path` together with the fingerprint of the
+    workbook they were parsed from.
+    """
+    fingerprint = source.manifest_fingerprint()
+    df = load_checkpoint(cache_path, fingerprint)
+    if df is not None:
+        click.echo("Loaded builds manifest from " + click.format_filename(cache_path))
+        return df, True
+
+    with source.open_manifest() as manifest:
+        df = pd.read_excel(manifest, usecols=lambda column: column in MANIFEST_COLUMNS)
+    df["Outcome"] = df["Outcome"].astype("category")
+    save_checkpoint(cache_path, fingerprint, df)
+    return df, False
@@ -0,0 +1,93 @@
+"""JavaScript shared by the post scripts of the HTML reports.
+
+Plotly marks its text as unselectable; every report makes it selectable again
+once the page has loaded. The scatter plots pin a tooltip to a clicked point,
+filled by a callback of the plot, so text can be selected and copied from it.
+"""
+
+
+def page_script(body):
+    """Run the JavaScript `body` once the page has loaded, with selectable text."""
+    return SELECTABLE_TEXT_SCRIPT + body + "});\n"
+
+
+SELECTABLE_TEXT_SCRIPT = """
+document.addEventListener('DOMContentLoaded', function() {
+    var elements = document.getElementsByClassName('user-select-none');
+    while (elements.length > 0) {
+        elements[0].classList.remove('user-select-none');
+    }
+"""
+
+# Defines appendLine(parent, label, text) and pinTooltips(plot, fillTooltip). The
+# tooltip of a clicked point shows its cluster label and build, taken from the
+# trace name, then whatever fillTooltip(tooltip, point) appends.
+PINNED_TOOLTIP_SCRIPT = """
+    function appendLine(parent, label, text) {
+        var line = document.createElement("div");
+        var name = document.createElement("b");
+        name.textContent = label + "=";
+        line.appendChild(name);
+        // Extracted logs are wrapped with <br> separators, render them as text lines
+        String(text).split("<br>").forEach(function(part, i) {
+            if (i > 0) {
+                line.appendChild(document.createElement("br"));
+            }
+            line.appendChild(document.createTextNode(part));
+        });
+        parent.appendChild(line);
+    }
+
+    function pinTooltips(plot, fillTooltip) {
+        var pinnedTooltip = null;
+
+        plot.on('plotly_click', function(eventData) {
+            if (pinnedTooltip) {
+                pinnedTooltip.remove();
+            }
+            var tooltip = document.createElement("div");
+            pinnedTooltip = tooltip;
+            // Mimic Plotly's hover label style
+            tooltip.style.position = "absolute";
+            tooltip.style.backgroundColor = "rgba(255, 255, 255, 0.85)";
+            tooltip.style.border = "1px solid #ccc";
+            tooltip.style.borderRadius = "3px";
+            tooltip.style.padding = "4px 8px";
+            tooltip.style.boxShadow = "0 2px 4px rgba(0,0,0,0.1)";
+            tooltip.style.fontFamily = "inherit";
+            tooltip.style.fontSize = "12px";
+            tooltip.style.color = "#2a3f5f";
+            tooltip.style.userSelect = "text";
+            tooltip.style.zIndex = 100;
+
+            // Trace names are like "19, maven"
+            var point = eventData.points[0];
+            if (point.data && point.data.name) {
+                var parts = point.data.name.split(",");
+                appendLine(tooltip, "Cluster label", parts[0].trim());
+                appendLine(tooltip, "Build", parts[1] ? parts[1].trim() : "");
+            }
+            fillTooltip(tooltip, point);
+
+            var offset = 10;
+            tooltip.style.left = (eventData.event.pageX + offset) + "px";
+            tooltip.style.top = (eventData.event.pageY + offset) + "px";
+            document.body.appendChild(tooltip);
+        });
+
+        // Remove the tooltip when clicking outside of it and the plot, or on Escape
+        document.addEventListener('click', function(e) {
+            if (pinnedTooltip && !pinnedTooltip.contains(e.target) && !plot.contains(e.target)) {
+                pinnedTooltip.remove();
+                pinnedTooltip = null;
+            }
+        });
+
+        document.addEventListener('keydown', function(e) {
+            if (e.key === 'Escape' && pinnedTooltip) {
+                pinnedTooltip.remove();
+                pinnedTooltip = null;
+            }
+        });
+    }
+"""
@@ -0,0 +1,113 @@
+import os
+import pickle
+
+import numpy as np
+from checkpoints import fingerprint, load_checkpoint, save_checkpoint
+
+# Rows UMAP is fitted on; the rest are transformed into the fitted layout
+UMAP_SAMPLE_SIZE = 20_000
+
+
+class Projector:
+    """Projects embeddings to 2D: PCA pre-reduction followed by UMAP.
+
+    Both are fitted on a stratified per-cluster sample of at most `sample_size`
+    rows, and every other row is transformed in chunks of `chunk_size` rows.
+    `pca_components` of 0 skips the PCA step.
+    """
+
+    def __init__(
+        self,
+        pca_components=50,
+        sample_size=UMAP_SAMPLE_SIZE,
+        chunk_size=8192,
+        min_dist=0.7,
+        random_state=42,
+    ):
+        self.pca_components = pca_components
+        self.sample_size = sample_size
+        self.chunk_size = chunk_size
+        self.min_dist = min_dist
+        self.random_state = random_state
+        self.pca = None
+        self.umap = None
+
+    def params(self):
+        return {
+            "pca_components": self.pca_components,
+            "sample_size": self.sample_size,
+            "min_dist": self.min_dist,
+            "random_state": self.random_state,
+        }
+
+    def fit_transform(self, embeddings, labels):
+        import umap
+        from clustering import stratified_sample
+        from sklearn.decomposition import PCA
+
+        sample = stratified_sample(labels, self.sample_size, self.random_state)
+        fit_embeddings = np.asarray(
+            embeddings if sample is None else embeddings[sample], dtype=np.float32
+        )
+        if 0 < self.pca_components < min(fit_embeddings.shape):
+            self.pca = PCA(
+                n_components=self.pca_components, random_state=self.random_state
+            ).fit(fit_embeddings)
+            fit_embeddings = self.pca.transform(fit_embeddings)
+
+        n_neighbors = 100 if len(fit_embeddings) > 100 else len(fit_embeddings) - 1
+        self.umap = umap.UMAP(
+            n_neighbors=n_neighbors,
+            min_dist=self.min_dist,
+            random_state=self.random_state,
+        ).fit(fit_embeddings)
+        if sample is None:
+            return self.umap.embedding_.astype(np.float32)
+        return self.transform(embeddings)
+
+    def transform(self, embeddings):
+        coordinates = np.empty((len(embeddings), 2), dtype=np.float32)
+        for start in range(0, len(embeddings), self.chunk_size):
+            chunk = np.asarray(embeddings[start : start + self.chunk_size], dtype=np.float32)
+            if self.pca is not None:
+                chunk = self.pca.transform(chunk)
+            coordinates[start : start + len(chunk)] = self.umap.transform(chunk)
+        return coordinates
+
+
+def project(
+    projector,
+    embeddings,
+    labels,
+    coordinates_path,
+    projector_path,
+    reuse=False,
+    resume=True,
+):
+    """Return the 2D coordinates of the embeddings and whether they were "fitted",
+    "cached" or "reused".
+
+    The coordinates are checkpointed at `coordinates_path`, keyed by the
+    embeddings, labels and parameters, and the projector that produced them is
+    pickled to `projector_path`. Unchanged inputs return the checkpointed
+    coordinates without unpickling the projector, which would import UMAP. With
+    `reuse`, changed embeddings are transformed with the pickled projector
+    instead of fitting a new one, which keeps the layout of earlier runs.
+    Without `resume`, checkpointed coordinates are ignored.
+    """
+    key = fingerprint(projector.params(), embeddings, np.asarray(labels, dtype=np.int64))
+    if os.path.exists(projector_path):
+        coordinates = load_checkpoint(coordinates_path, key) if resume else None
+        if coordinates is not None:
+            return coordinates, "cached"
+        if reuse:
+            with open(projector_path, "rb") as f:
+                coordinates = pickle.load(f).transform(embeddings)
+            save_checkpoint(coordinates_path, key, coordinates)
+            return coordinates, "reused"
+
+    coordinates = projector.fit_transform(embeddings, labels)
+    with open(projector_path, "wb") as f:
+        pickle.dump(projector, f)
+    save_checkpoint(coordinates_path, key, coordinates)
+    return coordinates, "fitted"
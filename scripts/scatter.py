@@ -0,0 +1,157 @@
+"""Helpers of the WebGL scatter plot.
+
+The WebGL plot embeds only coordinates, cluster and build type per point. The
+path, branch and extracted log shown in the pinned tooltip are written to
+sidecar scripts of `HOVER_CHUNK_SIZE` points each, which the page loads on
+demand. Script tags rather than fetch() are used so the report still works
+when opened from disk.
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+from page_scripts import PINNED_TOOLTIP_SCRIPT, page_script
+
+HOVER_CHUNK_SIZE = 1000
+
+
+def density_sample(x, y, labels, max_points, grid_size=None, random_state=42):
+    """Return the sorted positions of about `max_points` points to plot.
+
+    Points are binned into a grid per cluster and each cell keeps its share of
+    the budget in proportion to how many points it holds, so dense regions
+    stay denser than sparse ones. Every occupied cell keeps at least one point,
+    which keeps outliers and small clusters visible. The grid defaults to a
+    resolution whose cells number at most half of the budget.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    labels = np.asarray(labels, dtype=np.int64)
+    if len(x) <= max_points:
+        return np.arange(len(x))
+    if grid_size is None:
+        clusters = len(np.unique(labels))
+        grid_size = min(128, max(1, int(np.sqrt(max_points / (2 * clusters)))))
+
+    def bins(values):
+        span = values.max() - values.min()
+        positions = (values - values.min()) / (span or 1) * grid_size
+        return np.minimum(positions.astype(np.int64), grid_size - 1)
+
+    cells = (labels * grid_size + bins(x)) * grid_size + bins(y)
+    _, cell_of, counts = np.unique(cells, return_inverse=True, return_counts=True)
+
+    rng = np.random.default_rng(random_state)
+    # Round the proportional share of each cell randomly so the expected density is kept
+    shares = counts * (max_points / len(x))
+    keep = np.floor(shares) + (rng.random(len(counts)) < shares % 1)
+    keep = np.maximum(keep, 1).astype(np.int64)
+
+    # Shuffle, group by cell and keep the first points of each cell
+    order = rng.permutation(len(x))
+    order = order[np.argsort(cell_of[order], kind="stable")]
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    ranks = np.arange(len(x)) - starts
+    return np.sort(order[ranks < np.repeat(keep, counts)])
+
+
+def write_hover_payloads(payloads, data_dir):
+    """Write the tooltip payloads of the points, in point id order, as sidecar scripts."""
+    shutil.rmtree(data_dir, ignore_errors=True)
+    os.makedirs(data_dir)
+    for chunk, start in enumerate(range(0, len(payloads), HOVER_CHUNK_SIZE)):
+        with open(os.path.join(data_dir, f"hover-{chunk}.js"), "w", encoding="UTF-8") as f:
+            f.write(f"window.scatterHoverPayloads({chunk}, ")
+            json.dump(payloads[start : start + HOVER_CHUNK_SIZE], f, separators=(",", ":"))
+            f.write(");\n")
+
+
+def webgl_post_script(data_dir_name):
+    """Pinned tooltip of the WebGL plot, loading the payload of a clicked point."""
+    settings = (
+        f"var hoverChunkSize = {HOVER_CHUNK_SIZE};\n"
+        f"var hoverDataDir = {json.dumps(data_dir_name)};\n"
+    )
+    return settings + page_script(PINNED_TOOLTIP_SCRIPT + WEBGL_POST_SCRIPT)
+
+
+# Pinned tooltip of the inline plot, whose points carry their Path, Branch and
+# Extracted logs as customdata
+INLINE_POST_SCRIPT = page_script(
+    PINNED_TOOLTIP_SCRIPT
+    + """
+    var plot = document.querySelector(".plotly-graph-div");
+    if (plot) {
+        pinTooltips(plot, function(tooltip, point) {
+            if (point.customdata) {
+                appendLine(tooltip, "Path", point.customdata[0]);
+                appendLine(tooltip, "Branch", point.customdata[1]);
+                appendLine(tooltip, "Extracted logs", point.customdata[2]);
+            } else {
+                appendLine(tooltip, "X", point.x);
+                appendLine(tooltip, "Y", point.y);
+            }
+        });
+    }
+"""
+)
+
+WEBGL_POST_SCRIPT = """
+    // Loaded payload chunks, and the callbacks waiting for chunks being loaded
+    var chunks = {};
+    var pending = {};
+    window.scatterHoverPayloads = function(chunk, payloads) {
+        chunks[chunk] = payloads;
+        (pending[chunk] || []).forEach(function(callback) { callback(payloads); });
+        delete pending[chunk];
+    };
+
+    function loadPayload(pointId, callback) {
+        var chunk = Math.floor(pointId / hoverChunkSize);
+        var select = function(payloads) {
+            callback(payloads ? payloads[pointId % hoverChunkSize] : null);
+        };
+        if (chunks[chunk]) {
+            select(chunks[chunk]);
+            return;
+        }
+        if (!pending[chunk]) {
+            pending[chunk] = [];
+            var script = document.createElement("script");
+            script.src = hoverDataDir + "/hover-" + chunk + ".js";
+            script.onerror = function() {
+                (pending[chunk] || []).forEach(function(callback) { callback(null); });
+                delete pending[chunk];
+                script.remove();
+            };
+            document.head.appendChild(script);
+        }
+        pending[chunk].push(select);
+    }
+
+    var plot = document.querySelector(".plotly-graph-div");
+    if (plot) {
+        pinTooltips(plot, function(tooltip, point) {
+            var details = document.createElement("div");
+            details.textContent = "Loading...";
+            tooltip.appendChild(details);
+
+            // customdata rows may be decoded as arrays or typed arrays
+            var pointId = Number(
+                typeof point.customdata === "object" ? point.customdata[0] : point.customdata
+            );
+            loadPayload(pointId, function(payload) {
+                details.textContent = "";
+                if (!payload) {
+                    details.textContent = "Log unavailable, keep " + hoverDataDir + " next to this file";
+                    return;
+                }
+                appendLine(details, "Path", payload[0]);
+                appendLine(details, "Branch", payload[1]);
+                appendLine(details, "Extracted logs", payload[2]);
+            });
+        });
+    }
+"""
@@ -0,0 +1,56 @@
+"""Canonical failure signatures of extracted logs.
+
+Extracted logs of the same failure often differ only in volatile tokens such
+as timestamps, absolute paths, temporary directories, line numbers, hashes or
+version strings. Replacing those tokens with placeholders gives a signature
+that is shared by every occurrence of the failure, so each distinct signature
+only needs to be embedded and clustered once.
+"""
+
+import re
+
+# Applied in order: timestamps before versions so dates are not read as versions,
+# temporary directories before other paths so they get their own placeholder
+VOLATILE_TOKENS = [
+    (
+        re.compile(
+            r"\b\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2}(?:[.,]\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?\b"
+        ),
+        "<TIMESTAMP>",
+    ),
+    (re.compile(r"\b\d{4}-\d{2}-\d{2}\b"), "<DATE>"),
+    (re.compile(r"\b\d{1,2}:\d{2}:\d{2}(?:[.,]\d+)?\b"), "<TIME>"),
+    (
+        re.compile(
+            r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"
+        ),
+        "<UUID>",
+    ),
+    (
+        re.compile(
+            r"(?<![\w.])(?:/(?:private/)?(?:tmp|var/tmp|var/folders)|[A-Za-z]:\\(?:Windows\\Temp|Users\\[^\\\s]+\\AppData\\Local\\Temp))[^\s:,;'\"()\[\]]*"
+        ),
+        "<TMPDIR>",
+    ),
+    # Directories of absolute paths, keeping the file name
+    (re.compile(r"(?<![\w.<>:/])(?:/[\w.@+-]+)+/(?=[\w.@+-])"), "<PATH>/"),
+    (re.compile(r"\b[A-Za-z]:\\(?:[^\\\s:]+\\)+"), "<PATH>\\\\"),
+    (re.compile(r"(\.\w+|<TMPDIR>):\d+(?::\d+)?\b"), r"\1:<LINE>"),
+    # "line 42" and Gradle's "line: 42"
+    (re.compile(r"\b(line|Line|LINE)(:?[ \t]+)\d+\b"), r"\1\2<LINE>"),
+    # Hexadecimal strings holding both digits and letters, and long numeric ids
+    (
+        re.compile(
+            r"\b(?:(?=[0-9a-fA-F]*\d)(?=[0-9a-fA-F]*[a-fA-F])[0-9a-fA-F]{7,}|\d{10,})\b"
+        ),
+        "<HASH>",
+    ),
+    (re.compile(r"\bv?\d+(?:\.\d+){1,3}(?:[-+][\w.]+)?\b"), "<VERSION>"),
+]
+
+
+def normalize_signature(extracted_log):
+    """Return the extracted log with its volatile tokens replaced by placeholders."""
+    for pattern, placeholder in VOLATILE_TOKENS:
+        extracted_log = pattern.sub(placeholder, extracted_log)
+    return extracted_log
@@ -10,10 +10,9 @@ def prepare_directory(directory):
         os.makedirs(directory)
 
 
-def copy_directory(source, destination):
-    expanded_source = os.path.expanduser(source)
-    prepare_directory(destination)
-    shutil.copytree(expanded_source, destination, dirs_exist_ok=True)
+def directory_size(path):
+    """Total size of the files directly in `path`."""
+    return sum(entry.stat().st_size for entry in os.scandir(path))
 
 
 def normalize_url(url):
@@ -0,0 +1,81 @@
+"""Nearest-neighbour index over the failures of an analysis.
+
+`analyze` saves the embedding matrix of the distinct failure signatures next
+to the cluster model, with the Path, Branch, cluster and signature of every
+failure. The matrix is memory-mapped, so opening the index does not read it
+and a lookup streams it once.
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+
+INDEX_VECTORS = "index.npy"
+INDEX_ROWS = "index_rows.json"
+
+
+def save_index(model_dir, embeddings_path, paths, branches, clusters, signatures):
+    """Save the index of the failures, `signatures` being the row of each failure in
+    the embedding matrix at `embeddings_path`."""
+    shutil.copyfile(embeddings_path, os.path.join(model_dir, INDEX_VECTORS))
+    with open(os.path.join(model_dir, INDEX_ROWS), "w") as f:
+        json.dump(
+            {"Path": paths, "Branch": branches, "cluster": clusters, "signature": signatures},
+            f,
+        )
+
+
+class VectorIndex:
+    """Failures of an analysis searchable by the cosine similarity of their signatures."""
+
+    def __init__(self, model_dir, chunk_size=65536):
+        vectors_path = os.path.join(model_dir, INDEX_VECTORS)
+        if not os.path.exists(vectors_path):
+            raise FileNotFoundError(vectors_path)
+        self.vectors = np.load(vectors_path, mmap_mode="r")
+        with open(os.path.join(model_dir, INDEX_ROWS)) as f:
+            self.rows = json.load(f)
+        self.chunk_size = chunk_size
+        # Failures grouped by signature, the members of signature s being
+        # self.members[self.starts[s] : self.starts[s + 1]]
+        signatures = np.asarray(self.rows["signature"], dtype=np.int64)
+        self.members = np.argsort(signatures, kind="stable")
+        self.starts = np.concatenate(
+            [[0], np.cumsum(np.bincount(signatures, minlength=len(self.vectors)))]
+        )
+
+    def __len__(self):
+        return len(self.rows["signature"])
+
+    def similarities(self, query):
+        """Cosine similarity of every signature to a normalized query embedding."""
+        similarities = np.empty(len(self.vectors), dtype=np.float32)
+        for start in range(0, len(self.vectors), self.chunk_size):
+            chunk = self.vectors[start : start + self.chunk_size]
+            similarities[start : start + len(chunk)] = chunk @ query
+        return similarities
+
+    def search(self, query, k=5):
+        """Return the `k` failures most similar to a normalized query embedding."""
+        similarities = self.similarities(np.asarray(query, dtype=np.float32))
+        # Every signature has at least one failure, so k signatures are enough
+        candidates = min(k, len(similarities))
+        nearest = np.argpartition(-similarities, candidates - 1)[:candidates]
+        nearest = nearest[np.argsort(-similarities[nearest], kind="stable")]
+
+        results = []
+        for signature in nearest:
+            for row in self.members[self.starts[signature] : self.starts[signature + 1]]:
+                results.append(
+                    {
+                        "similarity": float(similarities[signature]),
+                        "Path": self.rows["Path"][row],
+                        "Branch": self.rows["Branch"][row],
+                        "cluster": self.rows["cluster"][row],
+                    }
+                )
+                if len(results) == k:
+                    return results
+        return results